@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+from array import array
+
+from events import SESSION_PAUSED, SESSION_RESET, SESSION_STARTED, TICK
+from pomodoro import SETTINGS_LIMITS
+
+ACTIVITY_ENV = "POMODORO_ACTIVITY_INTERVAL"  # секунд между замерами; без переменной или 0 замеров нет
+ACTIVITY_INTERVAL = 5  # период замеров при неверном значении переменной
+IDLE_AFTER = 120  # секунд без действий, после которых пользователь считается отвлёкшимся
+UNFOCUSED = 0x8000  # старший бит замера: окно приложения было не в фокусе
+IDLE_MASK = 0x7FFF  # младшие биты: секунд с последнего действия (с насыщением)
+
+logger = logging.getLogger(__name__)
+
+
+class ActivitySampler:
+    """Замеры сосредоточенности во время рабочей сессии таймера.
+
+    Пока идёт рабочая сессия, раз в interval секунд в кольцевой буфер пишется
+    замер: теряло ли окно приложения фокус с прошлого замера и сколько секунд
+    прошло с последнего действия пользователя. Замеры снимаются по тикам
+    таймера, своего потока нет; на паузе, в перерыве и после сброса сэмплер
+    отписан от тиков. Буфер выделяется один раз на самую длинную допустимую
+    рабочую сессию, по 2 байта на замер.
+
+    Интерфейс сообщает о действиях (interaction) и смене фокуса окна (focus).
+    При завершении рабочей сессии таймер вызывает finish() и пишет оценку
+    отвлечённости — долю замеров с отвлечением, 0..100 — в журнал вместе с сессией.
+    """
+
+    def __init__(self, timer, interval=ACTIVITY_INTERVAL, idle_after=IDLE_AFTER):
+        self.timer = timer
+        self.interval = interval
+        self.idle_after = idle_after
+        self.capacity = -(-SETTINGS_LIMITS["work_time"][1] // interval)
+        self._samples = array("H", bytes(2 * self.capacity))
+        self._next = 0  # позиция следующего замера в буфере
+        self._count = 0  # замеров в буфере
+        self._lock = threading.Lock()
+        self._tick = None  # подписка на тики, пока идёт рабочая сессия
+        self._sampled_at = None
+        self._last_action = timer.clock()
+        self._blurred = False  # окно теряло фокус после прошлого замера
+        self.focused = True
+        self.switches = 0  # потерь фокуса за текущую рабочую сессию
+        self.last_score = None  # оценка последней завершённой рабочей сессии
+        self._subscription = timer.events.subscribe(
+            (SESSION_STARTED, SESSION_PAUSED, SESSION_RESET), self._on_session_event
+        )
+        timer.activity = self
+        # Сессия, восстановленная из журнала, уже идёт без события старта
+        if timer.is_running and timer.is_work_time:
+            with self._lock:
+                self._start()
+
+    def _on_session_event(self, event):
+        with self._lock:
+            if event.type == SESSION_STARTED and self.timer.is_work_time:
+                self._start()
+                return
+            self._stop()
+            if event.type == SESSION_RESET:
+                self._clear()
+
+    def _start(self):
+        if self._tick is None:
+            self._sampled_at = self._last_action = self.timer.clock()
+            self._blurred = not self.focused
+            self._tick = self.timer.events.subscribe(TICK, self._on_tick)
+
+    def _stop(self):
+        if self._tick is not None:
+            self.timer.events.unsubscribe(self._tick)
+            self._tick = None
+
+    def _clear(self):
+        self._next = self._count = 0
+        self.switches = 0
+
+    def _on_tick(self, event):
+        now = self.timer.clock()
+        if now - self._sampled_at < self.interval:
+            return
+        with self._lock:
+            if self._tick is None:
+                return
+            self._sampled_at = now
+            idle = min(IDLE_MASK, int(now - self._last_action))
+            unfocused = self._blurred or not self.focused
+            self._blurred = False
+            self._samples[self._next] = idle | (UNFOCUSED if unfocused else 0)
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def interaction(self):
+        """Действие пользователя в интерфейсе"""
+        self._last_action = self.timer.clock()
+
+    def focus(self, focused):
+        """Окно приложения получило (True) или потеряло (False) фокус"""
+        self._last_action = self.timer.clock()
+        if not focused:
+            self._blurred = True
+            if self.focused and self._tick is not None:
+                self.switches += 1
+        self.focused = focused
+
+    def finish(self):
+        """Оценка завершённой рабочей сессии (0..100 или None без замеров); буфер очищается"""
+        with self._lock:
+            self._stop()
+            distracted = 0
+            for sample in self._samples[:self._count]:
+                if sample & UNFOCUSED or sample & IDLE_MASK >= self.idle_after:
+                    distracted += 1
+            score = round(100 * distracted / self._count) if self._count else None
+            self.last_score = score
+            self._clear()
+        return score
+
+    def close(self):
+        with self._lock:
+            self._stop()
+        self.timer.events.unsubscribe(self._subscription)
+        if self.timer.activity is self:
+            self.timer.activity = None
+
+
+def configured_interval():
+    """Период замеров из окружения; None — замеры выключены (по умолчанию)"""
+    value = os.environ.get(ACTIVITY_ENV)
+    if value is None:
+        return None
+    try:
+        interval = int(value)
+    except ValueError:
+        logger.warning("Неверное значение %s: %r, используется %s", ACTIVITY_ENV, value, ACTIVITY_INTERVAL)
+        return ACTIVITY_INTERVAL
+    return interval if interval > 0 else None
@@ -0,0 +1,176 @@
+import bisect
+import threading
+import time
+from array import array
+from datetime import date, datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # NumPy ускоряет агрегаты, но не обязателен
+    np = None
+
+HOURS = 24
+
+
+def _vectorize(fn, *columns):
+    """fn над столбцами целиком (NumPy) или поэлементно"""
+    if np is not None:
+        return fn(*columns)
+    return [fn(*values) for values in zip(*columns)]
+
+
+def _bincount(indices, weights, size):
+    """Суммы weights по корзинам indices (0..size-1)"""
+    if np is not None:
+        return np.bincount(indices, weights=weights, minlength=size)[:size].astype(int).tolist()
+    totals = [0] * size
+    for index, weight in zip(indices, weights):
+        totals[index] += weight
+    return totals
+
+
+class HistoryAnalytics:
+    """Аналитика по журналу сессий: тепловая карта, серии, часы дня и теги по неделям.
+
+    Журнал загружается один раз в столбцы (SessionColumns) с вычисленными
+    днём и часом окончания, дальше новые сессии дописываются по событию
+    session_completed. Сессии упорядочены по времени, поэтому диапазон дат —
+    срез столбцов через bisect, а агрегаты — bincount по срезу (NumPy, если
+    установлен). Результаты кэшируются по отчёту и диапазону; новая сессия
+    сбрасывает только записи кэша, в диапазон которых попадает её день.
+    """
+
+    def __init__(self, history, wall_clock=time.time):
+        self.history = history
+        self.wall_clock = wall_clock
+        self._lock = threading.Lock()
+        self._columns = None
+        self._day = array("i")  # порядковый номер дня окончания (date.toordinal)
+        self._hour = array("B")  # час окончания по местному времени
+        self._cache = {}  # (отчёт, первый день, последний день) -> результат
+
+    def preload(self):
+        """Загрузка журнала заранее (например, в фоновом потоке при старте)"""
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        """Загрузка журнала при первом запросе; вызывается под блокировкой"""
+        if self._columns is None:
+            self._columns = self.history.columns()
+            for ended_at in self._columns.ended_at:
+                self._index(ended_at)
+
+    def _index(self, ended_at):
+        moment = datetime.fromtimestamp(ended_at)
+        self._day.append(moment.toordinal())
+        self._hour.append(moment.hour)
+
+    def on_session_completed(self, event):
+        """Подписчик session_completed: дописывает сессию и сбрасывает затронутые отчёты"""
+        data = event.data
+        with self._lock:
+            if self._columns is None:
+                return  # журнал ещё не загружен, сессия попадёт в него при загрузке
+            columns = self._columns
+            if len(columns) and data["ended_at"] <= columns.ended_at[-1]:
+                return  # уже прочитана из журнала при загрузке
+            columns.append(data["kind"], data["tag"], data["started_at"], data["ended_at"], data["duration"])
+            self._index(data["ended_at"])
+            day = self._day[-1]
+            self._cache = {key: value for key, value in self._cache.items() if not key[1] <= day <= key[2]}
+
+    def _cached(self, report, first, last, compute):
+        key = (report, first.toordinal(), last.toordinal())
+        with self._lock:
+            self._load()
+            result = self._cache.get(key)
+            if result is None:
+                result = self._cache[key] = compute(key[1], key[2])
+            return result
+
+    def _work(self, first, last):
+        """Рабочие сессии дней first..last: (дни, часы, длительности, номера тегов)"""
+        columns = self._columns
+        lo = bisect.bisect_left(self._day, first)
+        hi = bisect.bisect_right(self._day, last)
+        work = columns.kind_code("work")
+        if work is None:
+            lo = hi
+        if np is not None:
+            mask = np.frombuffer(columns.kind_id, dtype=np.uint8)[lo:hi] == work
+            return tuple(
+                np.frombuffer(column, dtype=dtype)[lo:hi][mask]
+                for column, dtype in (
+                    (self._day, np.int32), (self._hour, np.uint8),
+                    (columns.duration, np.int64 if columns.duration.itemsize == 8 else np.int32),
+                    (columns.tag_id, np.int32),
+                )
+            )
+        rows = [i for i in range(lo, hi) if columns.kind_id[i] == work]
+        return tuple(
+            [column[i] for i in rows]
+            for column in (self._day, self._hour, columns.duration, columns.tag_id)
+        )
+
+    def heatmap(self, first, last):
+        """Минуты работы по дням: {date: минуты} для first..last (дни без работы — 0)"""
+        def compute(first, last):
+            days, _, durations, _ = self._work(first, last)
+            totals = _bincount(_vectorize(lambda day: day - first, days), durations, last - first + 1)
+            return {date.fromordinal(first + offset): seconds // 60 for offset, seconds in enumerate(totals)}
+        return self._cached("heatmap", first, last, compute)
+
+    def hours(self, first, last):
+        """Минуты работы по часам суток (список из 24 значений)"""
+        def compute(first, last):
+            _, hours, durations, _ = self._work(first, last)
+            return [seconds // 60 for seconds in _bincount(hours, durations, HOURS)]
+        return self._cached("hours", first, last, compute)
+
+    def tag_trends(self, first, last):
+        """Минуты работы по тегам и неделям: {тег: [минуты за неделю, ...]}.
+
+        Недели начинаются с понедельника недели first.
+        """
+        def compute(first, last):
+            monday = first - date.fromordinal(first).weekday()
+            weeks = (last - monday) // 7 + 1
+            days, _, durations, tags = self._work(first, last)
+            cells = _vectorize(lambda day, tag: (tag + 1) * weeks + (day - monday) // 7, days, tags)
+            names = [None] + self._columns.tags  # номер тега -1 — сессии без тега
+            totals = _bincount(cells, durations, len(names) * weeks)
+            trends = {}
+            for code, name in enumerate(names):
+                row = totals[code * weeks:(code + 1) * weeks]
+                if any(row):
+                    trends[name] = [seconds // 60 for seconds in row]
+            return trends
+        return self._cached("tags", first, last, compute)
+
+    def streaks(self, today=None):
+        """Текущая и самая длинная серия дней с работой: {"current": ..., "longest": ...}.
+
+        Текущая серия не прерывается, пока сегодня ещё не было работы.
+        """
+        today = today or datetime.fromtimestamp(self.wall_clock()).date()
+
+        def compute(first, last):
+            days, _, _, _ = self._work(first, last)
+            worked = np.unique(days).tolist() if np is not None else sorted(set(days))
+            longest = run = 0
+            previous = None
+            for day in worked:
+                run = run + 1 if previous == day - 1 else 1
+                longest = max(longest, run)
+                previous = day
+            current = run if worked and worked[-1] >= last - 1 else 0
+            return {"current": current, "longest": longest}
+
+        return self._cached("streaks", date.min, today, compute)
+
+
+def last_weeks(today, weeks):
+    """Диапазон дат из weeks полных недель, заканчивающийся неделей today"""
+    first = today - timedelta(days=today.weekday() + 7 * (weeks - 1))
+    return first, first + timedelta(days=7 * weeks - 1)
@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from history import SessionLog  # noqa: E402
+from pomodoro import PomodoroTimer  # noqa: E402
+from scheduler import TimerScheduler  # noqa: E402
+from simulation import VirtualClock, run_timer_sessions, simulated_timer  # noqa: E402
+from storage import ConnectionPool, JsonFileStorage, MemoryStorage, SqliteStorage  # noqa: E402
+
+
+def percentiles(values, factor=1, points=(50, 95, 99)):
+    """Перцентили по отсортированной выборке, умноженные на factor (перевод единиц)"""
+    if not values:
+        return {f"p{p}": None for p in points}
+    ordered = sorted(values)
+    last = len(ordered) - 1
+    return {f"p{p}": ordered[min(last, round(last * p / 100))] * factor for p in points}
+
+
+def timed(ops, fn):
+    """Выполнение fn и результат в операциях в секунду"""
+    started = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - started
+    return {"ops": ops, "seconds": seconds, "ops_per_sec": ops / seconds, "mean_us": seconds / ops * 1e6}
+
+
+def bench_update_timer(scale):
+    clock = VirtualClock(1.7e9)
+    timer = simulated_timer(clock)
+    timer.start_timer()
+    ops = 200_000 // scale
+
+    def run():
+        for _ in range(ops):
+            clock.advance(0.001)
+            timer.update_timer()
+
+    return timed(ops, run)
+
+
+def bench_complete_session(scale):
+    clock = VirtualClock(1.7e9)
+    timer = simulated_timer(clock)
+    ops = 20_000 // scale
+    return timed(ops, lambda: run_timer_sessions(timer, clock, ops))
+
+
+def bench_interface(scale):
+    from main import INTERFACE_EVENTS, build_interface
+    from recording_page import recording_page
+
+    page, conn = recording_page()
+    clock = VirtualClock(1.7e9)
+    timer = simulated_timer(clock)
+    started = time.perf_counter()
+    update_interface = build_interface(page, timer)
+    build_seconds = time.perf_counter() - started
+    timer.events.subscribe(INTERFACE_EVENTS, lambda event: update_interface())
+    initial_bytes = conn.total_bytes()
+
+    conn.reset()
+    timer.start_timer()
+    ticks = 2_000 // scale
+    durations = []
+    for _ in range(ticks):
+        clock.advance(1)
+        tick_started = time.perf_counter()
+        timer.update_timer()
+        durations.append(time.perf_counter() - tick_started)
+    sizes = [size for _, size in conn.updates]
+    return {
+        "build_seconds": build_seconds,
+        "initial_bytes": initial_bytes,
+        "ticks": ticks,
+        "tick_us": percentiles(durations, 1e6),
+        "updates_per_tick": len(conn.updates) / ticks,
+        "bytes_per_tick": sum(sizes) / ticks,
+        "update_bytes": percentiles(sizes),
+    }
+
+
+def measure(repeat, fn, setup=None):
+    """Перцентили длительности fn в мс; setup выполняется перед каждым повтором вне замера"""
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        durations.append(time.perf_counter() - started)
+    return percentiles(durations, 1e3)
+
+
+def populated_timer(storage, size):
+    """Таймер с size тегами и товарами, уже записанными в storage"""
+    # Фоновая запись не успевает сработать за замер: пишет только flush_data()
+    timer = PomodoroTimer(history=SessionLog(":memory:"), storage=storage, save_interval=3600)
+    for i in range(size):
+        timer.add_tag(f"Тег {i}", "blue")
+        timer.add_shop_item(f"Товар {i}", i, f"Описание товара {i}")
+    timer.flush_data()
+    return timer
+
+
+def bench_save_load(timer, repeat):
+    """save_data/flush_data с одним новым товаром и load_data при неизменном объёме данных"""
+    added = []
+
+    def replace_item():
+        # Товар прошлого повтора удаляется вне замера, чтобы данные не росли от повтора к повтору
+        if added:
+            timer.remove_shop_item(added.pop().id)
+            timer.flush_data()
+
+    def save():
+        added.append(timer.add_shop_item("Замер", 1, "Товар замера"))
+        timer.flush_data()
+
+    return {
+        "save_ms": measure(repeat, save, replace_item),
+        "load_ms": measure(repeat, timer.load_data),
+    }
+
+
+def bench_persistence(scale):
+    results = {}
+    repeat = max(3, 30 // scale)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in (10, 100, 1_000, 10_000):
+            json_path = os.path.join(directory, f"data_{size}.json")
+            json_timer = populated_timer(JsonFileStorage(json_path), size)
+            json_result = bench_save_load(json_timer, repeat)
+            json_timer.close()
+
+            pool = ConnectionPool(os.path.join(directory, f"users_{size}.db"))
+            sqlite_timer = populated_timer(SqliteStorage("bench", pool), size)
+            sqlite_result = bench_save_load(sqlite_timer, repeat)
+            sqlite_timer.close()
+            pool.close()
+
+            results[str(size)] = {
+                "json_save_ms": json_result["save_ms"],
+                "json_load_ms": json_result["load_ms"],
+                "json_bytes": os.path.getsize(json_path),
+                "sqlite_save_ms": sqlite_result["save_ms"],
+                "sqlite_load_ms": sqlite_result["load_ms"],
+            }
+    return results
+
+
+def bench_scheduler(scale):
+    results = {}
+    duration = 3.0 if scale == 1 else 1.5
+    scheduler = TimerScheduler()
+    for count in (100, 300, 1_000):
+        lateness = []
+        timers = []
+        for _ in range(count):
+            timer = PomodoroTimer(history=SessionLog(":memory:"), storage=MemoryStorage())
+
+            def on_tick(timer=timer):
+                # Тик должен прийти сразу после границы секунды
+                lateness.append((1.0 - timer.remaining_time() % 1.0) % 1.0)
+                timer.update_timer()
+
+            scheduler.register(timer, on_tick)
+            timers.append(timer)
+        cpu_started = time.process_time()
+        for timer in timers:
+            timer.start_timer()
+        time.sleep(duration)
+        cpu = time.process_time() - cpu_started
+        threads = threading.active_count()
+        for timer in timers:
+            timer.pause_timer()
+        results[str(count)] = {
+            "ticks": len(lateness),
+            "lateness_ms": percentiles(lateness, 1e3),
+            "cpu_per_tick_us": cpu / max(1, len(lateness)) * 1e6,
+            "threads": threads,
+        }
+    return results
+
+
+BENCHMARKS = {
+    "update_timer": bench_update_timer,
+    "complete_session": bench_complete_session,
+    "interface": bench_interface,
+    "persistence": bench_persistence,
+    "scheduler": bench_scheduler,
+}
+
+
+def revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры горячих путей таймера")
+    parser.add_argument("names", nargs="*", metavar="name", help=f"замеры: {', '.join(BENCHMARKS)}")
+    parser.add_argument("--quick", action="store_true", help="уменьшенные объёмы для быстрой проверки")
+    parser.add_argument("--output", help="файл для JSON-результатов (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"неизвестные замеры: {', '.join(unknown)}")
+
+    scale = 10 if args.quick else 1
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "quick": args.quick,
+        "results": {},
+    }
+    # Замеры пишут файлы данных во временный каталог, а не в рабочий
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            for name in args.names or BENCHMARKS:
+                report["results"][name] = BENCHMARKS[name](scale)
+        finally:
+            os.chdir(cwd)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+import argparse
+import asyncio
+import heapq
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from flet.core.event import Event
+
+# bench добавляет корень репозитория в sys.path, поэтому импортируется первым
+from bench import percentiles, revision
+from recording_page import recording_page
+
+import main as app  # noqa: E402
+from events import TICK  # noqa: E402
+from pomodoro import create_timer  # noqa: E402
+
+DEFAULT_SESSIONS = (10, 50, 100)
+DEFAULT_MIX = "toggle=3,buy=1,settings=1"
+SHOP_ITEMS = 10  # товаров у каждого пользователя
+START_POINTS = 1_000_000  # очков хватает на покупки до конца прогона
+
+
+class LoadServer:
+    """Сервер Flet без сети: цикл событий в отдельном потоке и пул потоков для обработчиков.
+
+    Так же устроен процесс ft.app: сессии живут в одном цикле событий,
+    синхронные main и обработчики выполняются в общем пуле потоков.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.executor = ThreadPoolExecutor()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="loadtest-loop", daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.executor.shutdown(wait=False)
+
+
+class FakeSession:
+    """Сессия браузера: страница на записывающем соединении и действия пользователя событиями контролов"""
+
+    def __init__(self, server, user_id):
+        self.server = server
+        self.user_id = user_id
+        self.page = None
+        self.conn = None
+        self.toggle_button = None
+        self.buy_buttons = []
+        self.work_time_field = None
+
+    async def open(self, target):
+        """Создание страницы и запуск target, как при подключении нового клиента"""
+        loop = asyncio.get_running_loop()
+        self.page, self.conn = recording_page(uuid.uuid4().hex, loop, self.server.executor, web=True)
+        self.conn.client_storage[app.USER_ID_KEY] = json.dumps(self.user_id)
+        if asyncio.iscoroutinefunction(target):
+            await target(self.page)
+        else:
+            await loop.run_in_executor(self.server.executor, target, self.page)
+        for control in walk(self.page.controls):
+            text = getattr(control, "text", None)
+            if text in ("Старт", "Пауза"):
+                self.toggle_button = control
+            elif text == "Купить":
+                self.buy_buttons.append(control)
+            elif getattr(control, "label", None) == "Время работы (мин)":
+                self.work_time_field = control
+
+    def fire(self, control, name, data=""):
+        """Событие контрола от клиента"""
+        return self.server.submit(self.page.on_event_async(Event(control.uid, name, data)))
+
+    def change(self, control, value):
+        """Ввод в поле: клиент присылает новое значение свойства, затем событие change"""
+        async def send():
+            await self.page.on_event_async(
+                Event("page", "change", json.dumps([{"i": control.uid, "value": value}]))
+            )
+            await self.page.on_event_async(Event(control.uid, "change", value))
+        return self.server.submit(send())
+
+    def close(self):
+        return self.fire(self.page, "close")
+
+
+def walk(controls):
+    """Все контролы дерева в глубину"""
+    for control in controls:
+        yield control
+        yield from walk(control._get_children())
+
+
+def toggle(session, rng):
+    session.fire(session.toggle_button, "click")
+
+
+def buy(session, rng):
+    if session.buy_buttons:
+        session.fire(rng.choice(session.buy_buttons), "click")
+
+
+def change_settings(session, rng):
+    session.change(session.work_time_field, str(rng.randint(20, 30)))
+
+
+ACTIONS = {"toggle": toggle, "buy": buy, "settings": change_settings}
+
+
+class TickRecorder:
+    """Опоздания тиков всех таймеров процесса: таймеры перехватываются при создании в main"""
+
+    def __init__(self):
+        self.lateness = []
+        self._create_timer = app.create_timer
+        app.create_timer = self.create_timer
+
+    def create_timer(self, user_id=None):
+        timer = self._create_timer(user_id)
+
+        def on_tick(event):
+            # Тик должен прийти сразу после границы секунды
+            self.lateness.append((1.0 - timer.remaining_time() % 1.0) % 1.0)
+
+        timer.events.subscribe(TICK, on_tick)
+        return timer
+
+    def reset(self):
+        lateness, self.lateness = self.lateness, []
+        return lateness
+
+    def close(self):
+        app.create_timer = self._create_timer
+
+
+def seed_user(user_id):
+    """Пользователь с товарами в магазине и запасом очков"""
+    timer = create_timer(user_id)
+    for i in range(SHOP_ITEMS):
+        timer.add_shop_item(f"Товар {i}", 1 + i, f"Описание товара {i}")
+    timer.ledger.adjust(START_POINTS, "Нагрузочный тест", time.time())
+    timer.close()
+
+
+def rss_bytes():
+    """Текущий RSS процесса (Linux), иначе пиковый"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def drive(sessions, duration, interval, mix, rng):
+    """Действия пользователей в течение duration секунд; возвращает их число.
+
+    Каждая сессия действует в среднем раз в interval секунд (экспоненциальные
+    паузы), вид действия выбирается по весам mix.
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    now = time.monotonic()
+    finish = now + duration
+    queue = [(now + rng.expovariate(1 / interval), index) for index in range(len(sessions))]
+    heapq.heapify(queue)
+    actions = 0
+    while queue:
+        due, index = queue[0]
+        if due >= finish:
+            break
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        ACTIONS[rng.choices(names, weights)[0]](sessions[index], rng)
+        actions += 1
+        heapq.heapreplace(queue, (due + rng.expovariate(1 / interval), index))
+    time.sleep(max(0.0, finish - time.monotonic()))
+    return actions
+
+
+def measure_step(sessions, recorder, duration, interval, mix, rng):
+    for session in sessions:
+        session.conn.reset()
+    recorder.reset()
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    actions = drive(sessions, duration, interval, mix, rng)
+    seconds = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    lateness = recorder.reset()
+    sizes = [size for session in sessions for _, size in session.conn.updates]
+    return {
+        "sessions": len(sessions),
+        "seconds": seconds,
+        "actions": actions,
+        "ticks": len(lateness),
+        "tick_lateness_ms": percentiles(lateness, 1e3),
+        "updates_per_sec": len(sizes) / seconds,
+        "updates_per_session_sec": len(sizes) / seconds / len(sessions),
+        "update_bytes": percentiles(sizes),
+        "bytes_per_sec": sum(sizes) / seconds,
+        "cpu_percent": cpu / seconds * 100,
+        "threads": threading.active_count(),
+        "rss_mb": rss_bytes() / 2**20,
+    }
+
+
+def run(steps, duration, interval, mix, use_async=False, seed=0):
+    """Прогон с ростом числа сессий до каждого значения steps; результаты по шагам"""
+    rng = random.Random(seed)
+    target = app.main_async if use_async else app.main
+    server = LoadServer()
+    recorder = TickRecorder()
+    sessions = []
+    results = []
+    try:
+        for count in steps:
+            started = time.perf_counter()
+            while len(sessions) < count:
+                session = FakeSession(server, uuid.uuid4().hex)
+                seed_user(session.user_id)
+                server.submit(session.open(target)).result()
+                sessions.append(session)
+                session.fire(session.toggle_button, "click").result()
+            ramp_seconds = time.perf_counter() - started
+            result = measure_step(sessions, recorder, duration, interval, mix, rng)
+            result["ramp_seconds"] = ramp_seconds
+            results.append(result)
+            print(
+                f"{count} сессий: тик p99 {result['tick_lateness_ms']['p99']} мс, "
+                f"{result['updates_per_sec']:.0f} отправок/с, RSS {result['rss_mb']:.0f} МБ",
+                file=sys.stderr,
+            )
+    finally:
+        wait([session.close() for session in sessions], timeout=30)
+        recorder.close()
+        server.close()
+    return results
+
+
+def parse_mix(value):
+    """Веса действий из строки вида toggle=3,buy=1,settings=1"""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"неизвестное действие: {name}")
+        try:
+            mix[name] = float(weight or 1)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"неверный вес действия {name}: {weight}") from None
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный прогон интерфейса: N сессий Flet в одном процессе")
+    parser.add_argument("--sessions", type=int, nargs="+", default=DEFAULT_SESSIONS,
+                        help="число сессий на каждом шаге (по возрастанию)")
+    parser.add_argument("--duration", type=float, default=10.0, help="секунд замера на каждом шаге")
+    parser.add_argument("--interval", type=float, default=5.0, help="средняя пауза между действиями сессии, с")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f"веса действий {', '.join(ACTIONS)} (по умолчанию {DEFAULT_MIX})")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="асинхронный вариант main")
+    parser.add_argument("--seed", type=int, default=0, help="зерно расписания действий")
+    parser.add_argument("--output", help="файл для JSON-результатов (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    report = {
+        "revision": revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "async": args.use_async,
+        "duration": args.duration,
+        "interval": args.interval,
+        "mix": args.mix,
+        "steps": [],
+    }
+    # Общая база пользователей создаётся во временном каталоге, а не в рабочем
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            report["steps"] = run(
+                sorted(args.sessions), args.duration, args.interval, args.mix, args.use_async, args.seed
+            )
+        finally:
+            os.chdir(cwd)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import asyncio
+import itertools
+import json
+
+import flet as ft
+from flet.core.connection import Connection
+from flet.core.event import Event
+from flet.core.protocol import (
+    CommandEncoder,
+    PageCommandResponsePayload,
+    PageCommandsBatchResponsePayload,
+)
+
+
+class RecordingConnection(Connection):
+    """Соединение Flet без клиента: команды не отправляются, а записываются с размером.
+
+    На вызовы методов клиента соединение отвечает само, как браузер:
+    clientStorage читает и пишет словарь client_storage, остальные методы
+    возвращают пустой результат.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._ids = itertools.count(1)
+        self.updates = []  # (число команд, размер в байтах) для каждой отправки
+        self.client_storage = {}  # ключ -> значение в JSON, как его хранит клиент
+        self.page = None
+
+    def _record(self, commands):
+        payload = json.dumps(commands, cls=CommandEncoder, separators=(",", ":"))
+        self.updates.append((len(commands), len(payload.encode("utf-8"))))
+
+    def send_command(self, session_id, command):
+        self._record([command])
+        if command.name == "invokeMethod":
+            self._invoke_method(command.values[0], command.values[1], command.attrs)
+        return PageCommandResponsePayload(result="", error="")
+
+    def _invoke_method(self, method_id, method_name, arguments):
+        """Ответ клиента на вызов метода: событие invoke_method_result странице"""
+        result = None
+        if method_name == "clientStorage:get":
+            value = self.client_storage.get(arguments["key"])
+            result = None if value is None else json.dumps(value)
+        elif method_name == "clientStorage:set":
+            self.client_storage[arguments["key"]] = arguments["value"]
+            result = "true"
+        if self.page is not None:
+            data = json.dumps({"method_id": method_id, "result": result, "error": ""})
+            self.page._get_event_handler("invoke_method_result")(Event("page", "invoke_method_result", data))
+
+    def send_commands(self, session_id, commands):
+        self._record(commands)
+        results = [
+            " ".join(f"_{next(self._ids)}" for _ in command.commands)
+            for command in commands
+            if command.name == "add"
+        ]
+        return PageCommandsBatchResponsePayload(results=results, error="")
+
+    def reset(self):
+        self.updates.clear()
+
+    def total_bytes(self):
+        return sum(size for _, size in self.updates)
+
+
+def recording_page(session_id="bench", loop=None, executor=None, web=False):
+    """Страница Flet поверх записывающего соединения; web=True — страница веб-клиента"""
+    conn = RecordingConnection()
+    page = ft.Page(conn, session_id, loop or asyncio.new_event_loop(), executor)
+    conn.page = page
+    if web:
+        page._set_attr("web", True, dirty=False)
+    return page, conn
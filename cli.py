@@ -0,0 +1,53 @@
+import argparse
+import sys
+
+from persistence import atomic_write_json, read_json
+from pomodoro import PomodoroTimer
+
+CLI_STATE_FILE = "pomodoro_cli_state.json"
+
+
+def open_timer(state_file):
+    """Таймер с восстановленной сессией; просроченная сессия завершается сразу"""
+    timer = PomodoroTimer()
+    state = read_json(state_file)
+    if isinstance(state, dict):
+        timer.restore_running_state(state)
+    timer.update_timer()
+    return timer
+
+
+def format_status(timer):
+    """Строка состояния таймера"""
+    status = "Рабочее время" if timer.is_work_time else "Перерыв"
+    running = "идёт" if timer.is_running else "пауза"
+    return (
+        f"{status} {timer.format_time(timer.current_time)} ({running}), "
+        f"тег: {timer.current_tag}, очки: {timer.points}, всего помодоро: {timer.total_pomodoros}"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Помодоро-таймер без графического интерфейса")
+    parser.add_argument("command", choices=("start", "pause", "reset", "status"))
+    parser.add_argument("--tag", help="тег текущей сессии")
+    parser.add_argument("--state", default=CLI_STATE_FILE, help="файл состояния сессии")
+    args = parser.parse_args(argv)
+
+    timer = open_timer(args.state)
+    if args.tag:
+        timer.current_tag = args.tag
+    if args.command == "start":
+        timer.start_timer()
+    elif args.command == "pause":
+        timer.pause_timer()
+    elif args.command == "reset":
+        timer.reset_timer()
+    atomic_write_json(args.state, timer.running_state())
+    timer.close()
+    print(format_status(timer))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
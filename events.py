@@ -0,0 +1,102 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Типы событий таймера
+TICK = "tick"  # смена отображаемой секунды запущенного таймера
+SESSION_STARTED = "session_started"  # старт или продолжение сессии
+SESSION_PAUSED = "session_paused"
+SESSION_RESET = "session_reset"
+SESSION_COMPLETED = "session_completed"
+BREAK_STARTED = "break_started"  # после рабочей сессии выставлен перерыв
+POINTS_CHANGED = "points_changed"
+SETTINGS_CHANGED = "settings_changed"
+STATS_CHANGED = "stats_changed"  # агрегаты перечитаны с наступлением нового дня
+
+EVENT_TYPES = (
+    TICK, SESSION_STARTED, SESSION_PAUSED, SESSION_RESET, SESSION_COMPLETED,
+    BREAK_STARTED, POINTS_CHANGED, SETTINGS_CHANGED, STATS_CHANGED,
+)
+
+
+class Event:
+    """Событие таймера: тип и данные"""
+
+    __slots__ = ("type", "data")
+
+    def __init__(self, type, data):
+        self.type = type
+        self.data = data
+
+    def __repr__(self):
+        return f"Event({self.type!r}, {self.data!r})"
+
+
+class Subscription:
+    """Подписка на события; нужна для отписки"""
+
+    __slots__ = ("types", "callback", "dispatch")
+
+    def __init__(self, types, callback, dispatch):
+        self.types = types
+        self.callback = callback
+        self.dispatch = dispatch
+
+    def deliver(self, event):
+        try:
+            self.callback(event)
+        except Exception:
+            logger.exception("Ошибка обработчика события %s", event.type)
+
+
+class EventBus:
+    """Шина событий таймера.
+
+    Подписчики хранятся неизменяемыми кортежами по типам, поэтому publish()
+    не берёт блокировку, а событие без подписчиков стоит одного поиска в словаре.
+    Обработчик без dispatch вызывается сразу в потоке публикации; dispatch —
+    функция вида dispatch(fn, event), например ThreadPoolExecutor.submit или
+    loop.call_soon_threadsafe, для выполнения в пуле потоков или цикле событий.
+    Ошибка обработчика записывается в лог и не мешает остальным.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}  # тип -> кортеж подписок
+
+    def subscribe(self, types, callback, dispatch=None):
+        """Подписка callback(event) на тип или несколько типов событий"""
+        types = (types,) if isinstance(types, str) else tuple(types)
+        unknown = [event_type for event_type in types if event_type not in EVENT_TYPES]
+        if unknown:
+            raise ValueError(f"Неизвестные типы событий: {', '.join(unknown)}")
+        subscription = Subscription(types, callback, dispatch)
+        with self._lock:
+            for event_type in types:
+                self._subscribers[event_type] = self._subscribers.get(event_type, ()) + (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for event_type in subscription.types:
+                remaining = tuple(s for s in self._subscribers.get(event_type, ()) if s is not subscription)
+                if remaining:
+                    self._subscribers[event_type] = remaining
+                else:
+                    self._subscribers.pop(event_type, None)
+
+    def has_subscribers(self, event_type):
+        return event_type in self._subscribers
+
+    def publish(self, event_type, **data):
+        """Рассылка события подписчикам его типа"""
+        subscribers = self._subscribers.get(event_type)
+        if not subscribers:
+            return
+        event = Event(event_type, data)
+        for subscription in subscribers:
+            if subscription.dispatch is None:
+                subscription.deliver(event)
+            else:
+                subscription.dispatch(subscription.deliver, event)
@@ -0,0 +1,206 @@
+import argparse
+import csv
+import itertools
+import json
+import os
+import sys
+
+from persistence import atomic_write_json, read_json
+from pomodoro import create_timer
+
+FORMATS = ("jsonl", "csv", "columns")
+BATCH = 1000  # записей в порции чтения, импорта и в блоке столбцового формата
+CHECKPOINT_FILE = "pomodoro_export_checkpoint.json"  # {пользователь: контрольная точка}; "" — локальные данные
+
+SESSION_FIELDS = ("id", "kind", "tag", "started_at", "ended_at", "duration", "distraction")
+LEDGER_FIELDS = ("id", "kind", "amount", "reason", "time")
+CSV_FIELDS = (
+    "type", "id", "kind", "tag", "started_at", "ended_at", "duration", "distraction", "amount", "reason", "time",
+)
+
+
+def optional_int(value):
+    """Целое из CSV; пустое значение (или столбец из старой выгрузки без него) — None"""
+    return int(value) if value else None
+
+
+# Типы полей при чтении CSV, где всё приходит строками
+CSV_TYPES = {
+    "session": {"id": int, "started_at": float, "ended_at": float, "duration": int, "distraction": optional_int},
+    "ledger": {"id": int, "amount": int, "time": float},
+}
+
+
+def session_records(history, after_id=0):
+    """Сессии журнала с id больше after_id — генератор словарей с полем type"""
+    for row in history.iter_sessions(after_id, BATCH):
+        yield dict(zip(SESSION_FIELDS, row), type="session")
+
+
+def history_records(timer, checkpoint=None):
+    """Сессии и записи очков после checkpoint — генератор словарей с полем type"""
+    checkpoint = checkpoint or {}
+    yield from session_records(timer.history, checkpoint.get("session", 0))
+    for entry in timer.ledger.entries(checkpoint.get("ledger", 0)):
+        yield dict(entry, type="ledger")
+
+
+def write_jsonl(records, f):
+    for record in records:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def read_jsonl(f):
+    for line in f:
+        if line.strip():
+            yield json.loads(line)
+
+
+def write_csv(records, f):
+    writer = csv.DictWriter(f, CSV_FIELDS)
+    writer.writeheader()
+    writer.writerows(records)
+
+
+def read_csv(f):
+    for row in csv.DictReader(f):
+        record_type = row["type"]
+        fields = SESSION_FIELDS if record_type == "session" else LEDGER_FIELDS
+        record = {"type": record_type}
+        for field in fields:
+            value = row.get(field)
+            convert = CSV_TYPES[record_type].get(field)
+            record[field] = convert(value) if convert else (value or None)
+        yield record
+
+
+def write_columns(records, f):
+    """Столбцовый формат: строка JSON на блок из BATCH записей одного типа"""
+    for record_type, group in itertools.groupby(records, key=lambda record: record["type"]):
+        fields = SESSION_FIELDS if record_type == "session" else LEDGER_FIELDS
+        while True:
+            block = list(itertools.islice(group, BATCH))
+            if not block:
+                break
+            columns = {field: [record[field] for record in block] for field in fields}
+            f.write(json.dumps({"type": record_type, "columns": columns}, ensure_ascii=False) + "\n")
+
+
+def read_columns(f):
+    for block in read_jsonl(f):
+        fields = list(block["columns"])
+        for values in zip(*block["columns"].values()):
+            record = dict(zip(fields, values))
+            record["type"] = block["type"]
+            yield record
+
+
+WRITERS = {"jsonl": write_jsonl, "csv": write_csv, "columns": write_columns}
+READERS = {"jsonl": read_jsonl, "csv": read_csv, "columns": read_columns}
+
+
+def export_history(timer, f, fmt="jsonl", checkpoint=None):
+    """Выгрузка записей после checkpoint; возвращает их число и новую контрольную точку"""
+    checkpoint = dict(checkpoint or {})
+    count = 0
+
+    def tracked():
+        nonlocal count
+        for record in history_records(timer, dict(checkpoint)):
+            count += 1
+            yield record
+            checkpoint[record["type"]] = max(checkpoint.get(record["type"], 0), record["id"])
+
+    WRITERS[fmt](tracked(), f)
+    return count, checkpoint
+
+
+def import_history(timer, records, progress=None, save_progress=None):
+    """Загрузка записей порциями с пропуском уже известных.
+
+    progress — {"records": обработано} прошлого прерванного импорта: столько
+    записей пропускается. После каждой порции данные таймера сбрасываются на
+    диск и вызывается save_progress(progress), поэтому импорт продолжается с
+    последней порции, а её повтор безопасен благодаря проверке дублей.
+    """
+    progress = dict(progress or {"records": 0})
+    added = {"session": 0, "ledger": 0}
+    records = itertools.islice(records, progress["records"], None)
+    while True:
+        batch = list(itertools.islice(records, BATCH))
+        if not batch:
+            return added
+        added["session"] += timer.history.merge(
+            (
+                record["kind"], record["tag"], record["started_at"], record["ended_at"], record["duration"],
+                record.get("distraction"),  # в выгрузках до появления оценки её нет
+            )
+            for record in batch if record["type"] == "session"
+        )
+        added["ledger"] += timer.ledger.merge(record for record in batch if record["type"] == "ledger")
+        timer.flush_data()
+        progress["records"] += len(batch)
+        if save_progress is not None:
+            save_progress(progress)
+
+
+def user_checkpoints(path):
+    """Контрольные точки выгрузки по пользователям.
+
+    id сессий общие для всех пользователей базы, поэтому у каждого своя точка.
+    Файл старого формата с одной точкой относится к локальным данным.
+    """
+    checkpoints = read_json(path)
+    if not isinstance(checkpoints, dict):
+        return {}
+    if any(isinstance(value, int) for value in checkpoints.values()):
+        return {"": checkpoints}
+    return checkpoints
+
+
+def detect_format(path):
+    return "csv" if path.endswith(".csv") else "jsonl"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Обмен журналом сессий и очков между устройствами")
+    parser.add_argument("command", choices=("export", "import"))
+    parser.add_argument("path", help="файл выгрузки")
+    parser.add_argument("--format", choices=FORMATS, help="формат (по умолчанию по расширению: csv или jsonl)")
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE, help="контрольная точка выгрузки")
+    parser.add_argument("--full", action="store_true", help="выгрузить всё, не только новое с прошлой выгрузки")
+    parser.add_argument("--user", help="пользователь общей базы (по умолчанию локальные данные)")
+    args = parser.parse_args(argv)
+    fmt = args.format or detect_format(args.path)
+
+    timer = create_timer(args.user)
+    try:
+        if args.command == "export":
+            checkpoints = user_checkpoints(args.checkpoint)
+            user = args.user or ""
+            checkpoint = None if args.full else checkpoints.get(user)
+            tmp_path = f"{args.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+                count, checkpoint = export_history(timer, f, fmt, checkpoint)
+            os.replace(tmp_path, args.path)
+            # Точка сдвигается только после того, как выгрузка целиком записана
+            checkpoints[user] = checkpoint
+            atomic_write_json(args.checkpoint, checkpoints)
+            print(f"Выгружено записей: {count}")
+        else:
+            progress_path = f"{args.path}.progress"
+            with open(args.path, "r", encoding="utf-8", newline="") as f:
+                added = import_history(
+                    timer, READERS[fmt](f), read_json(progress_path),
+                    lambda progress: atomic_write_json(progress_path, progress),
+                )
+            if os.path.exists(progress_path):
+                os.remove(progress_path)
+            print(f"Добавлено сессий: {added['session']}, записей очков: {added['ledger']}")
+    finally:
+        timer.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
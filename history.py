@@ -0,0 +1,308 @@
+from datetime import datetime, time, timedelta
+
+from records import SessionColumns
+from storage import ConnectionPool
+
+HISTORY_FILE = "pomodoro_history.db"
+
+PERIODS = ("day", "week", "month")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL DEFAULT '',
+    kind TEXT NOT NULL,
+    tag TEXT,
+    started_at REAL NOT NULL,
+    ended_at REAL NOT NULL,
+    duration INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    week TEXT NOT NULL,
+    month TEXT NOT NULL,
+    distraction INTEGER  -- оценка отвлечённости рабочей сессии 0..100, если велись замеры
+);
+CREATE INDEX IF NOT EXISTS sessions_by_user_day ON sessions(user_id, day);
+CREATE INDEX IF NOT EXISTS sessions_by_user_week ON sessions(user_id, week);
+CREATE INDEX IF NOT EXISTS sessions_by_user_month ON sessions(user_id, month);
+CREATE INDEX IF NOT EXISTS sessions_by_user_end ON sessions(user_id, ended_at);
+
+-- Журнал только дополняется
+CREATE TRIGGER IF NOT EXISTS sessions_no_update BEFORE UPDATE ON sessions
+BEGIN SELECT RAISE(ABORT, 'sessions is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS sessions_no_delete BEFORE DELETE ON sessions
+BEGIN SELECT RAISE(ABORT, 'sessions is append-only'); END;
+
+-- Агрегаты по периодам, обновляются вместе с каждой записью журнала
+CREATE TABLE IF NOT EXISTS rollups (
+    user_id TEXT NOT NULL DEFAULT '',
+    period TEXT NOT NULL,
+    key TEXT NOT NULL,
+    work INTEGER NOT NULL DEFAULT 0,
+    break INTEGER NOT NULL DEFAULT 0,
+    pomodoros INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, period, key)
+) WITHOUT ROWID;
+
+-- Рабочее время по тегам за периоды, обновляется вместе с журналом
+CREATE TABLE IF NOT EXISTS tag_rollups (
+    user_id TEXT NOT NULL DEFAULT '',
+    period TEXT NOT NULL,
+    key TEXT NOT NULL,
+    tag TEXT NOT NULL,
+    work INTEGER NOT NULL DEFAULT 0,
+    pomodoros INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, period, key, tag)
+) WITHOUT ROWID;
+"""
+
+# Журнал первой версии был общим для всех: его записи относятся к пользователю ''
+MIGRATE_SHARED_LOG = """
+DROP INDEX IF EXISTS sessions_by_day;
+DROP INDEX IF EXISTS sessions_by_week;
+DROP INDEX IF EXISTS sessions_by_month;
+ALTER TABLE sessions ADD COLUMN user_id TEXT NOT NULL DEFAULT '';
+ALTER TABLE rollups RENAME TO rollups_shared;
+"""
+
+# Агрегаты по тегам появились позже журнала: они один раз досчитываются по его записям
+BACKFILL_TAG_ROLLUPS = """
+INSERT INTO tag_rollups (user_id, period, key, tag, work, pomodoros)
+SELECT user_id, 'day', day, tag, SUM(duration), COUNT(*) FROM sessions
+WHERE kind = 'work' AND tag IS NOT NULL GROUP BY user_id, day, tag
+UNION ALL
+SELECT user_id, 'week', week, tag, SUM(duration), COUNT(*) FROM sessions
+WHERE kind = 'work' AND tag IS NOT NULL GROUP BY user_id, week, tag
+UNION ALL
+SELECT user_id, 'month', month, tag, SUM(duration), COUNT(*) FROM sessions
+WHERE kind = 'work' AND tag IS NOT NULL GROUP BY user_id, month, tag;
+"""
+
+
+def period_keys(timestamp):
+    """Ключи дня, ISO-недели и месяца для момента времени (локальное время)"""
+    moment = datetime.fromtimestamp(timestamp)
+    year, week, _ = moment.isocalendar()
+    return {
+        "day": moment.strftime("%Y-%m-%d"),
+        "week": f"{year}-W{week:02d}",
+        "month": moment.strftime("%Y-%m"),
+    }
+
+
+def next_day(timestamp):
+    """Начало дня, следующего за моментом времени (локальное время)"""
+    moment = datetime.fromtimestamp(timestamp)
+    return datetime.combine(moment.date() + timedelta(days=1), time.min).timestamp()
+
+
+def empty_stats():
+    return {"work": 0, "break": 0, "pomodoros": 0}
+
+
+class SessionLog:
+    """Журнал завершённых сессий пользователя в SQLite (WAL) с агрегатами за день/неделю/месяц"""
+
+    def __init__(self, path=HISTORY_FILE, user_id="", pool=None):
+        self._owns_pool = pool is None
+        self.pool = ConnectionPool(path, size=1) if pool is None else pool
+        self.path = self.pool.path
+        self.user_id = user_id
+        with self.pool.connection() as conn:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+            if columns and "user_id" not in columns:
+                conn.executescript(MIGRATE_SHARED_LOG)
+            if columns and "distraction" not in columns:
+                # Оценка отвлечённости появилась позже журнала: у старых сессий её нет
+                conn.execute("ALTER TABLE sessions ADD COLUMN distraction INTEGER")
+            backfill = bool(columns) and not conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'tag_rollups'"
+            ).fetchone()
+            conn.executescript(SCHEMA)
+            if backfill:
+                conn.executescript(BACKFILL_TAG_ROLLUPS)
+            if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'rollups_shared'").fetchone():
+                conn.executescript(
+                    "INSERT INTO rollups (user_id, period, key, work, break, pomodoros)"
+                    " SELECT '', period, key, work, break, pomodoros FROM rollups_shared;"
+                    " DROP TABLE rollups_shared;"
+                )
+
+    def record(self, kind, tag, started_at, ended_at, duration, distraction=None):
+        """Добавление сессии в журнал и обновление агрегатов одной транзакцией"""
+        with self.pool.connection() as conn:
+            return self._insert(conn, kind, tag, started_at, ended_at, duration, distraction)
+
+    def merge(self, sessions):
+        """Добавление сессий (kind, tag, started_at, ended_at, duration, distraction), которых ещё нет в журнале.
+
+        Сессия считается той же, если у пользователя уже есть сессия того же вида
+        с тем же временем окончания. Все сессии пишутся одной транзакцией;
+        возвращается число добавленных.
+        """
+        added = 0
+        with self.pool.connection() as conn:
+            for kind, tag, started_at, ended_at, duration, distraction in sessions:
+                exists = conn.execute(
+                    "SELECT 1 FROM sessions WHERE user_id = ? AND ended_at = ? AND kind = ?",
+                    (self.user_id, ended_at, kind),
+                ).fetchone()
+                if not exists:
+                    self._insert(conn, kind, tag, started_at, ended_at, duration, distraction)
+                    added += 1
+        return added
+
+    def _insert(self, conn, kind, tag, started_at, ended_at, duration, distraction=None):
+        """Запись сессии и агрегатов в открытой транзакции"""
+        keys = period_keys(ended_at)
+        work = duration if kind == "work" else 0
+        rest = 0 if kind == "work" else duration
+        pomodoros = 1 if kind == "work" else 0
+        cursor = conn.execute(
+            "INSERT INTO sessions"
+            " (user_id, kind, tag, started_at, ended_at, duration, day, week, month, distraction)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.user_id, kind, tag, started_at, ended_at, duration,
+             keys["day"], keys["week"], keys["month"], distraction),
+        )
+        conn.executemany(
+            "INSERT INTO rollups (user_id, period, key, work, break, pomodoros)"
+            " VALUES (?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT (user_id, period, key) DO UPDATE SET"
+            " work = work + excluded.work,"
+            " break = break + excluded.break,"
+            " pomodoros = pomodoros + excluded.pomodoros",
+            [(self.user_id, period, keys[period], work, rest, pomodoros) for period in PERIODS],
+        )
+        if kind == "work" and tag:
+            conn.executemany(
+                "INSERT INTO tag_rollups (user_id, period, key, tag, work, pomodoros)"
+                " VALUES (?, ?, ?, ?, ?, 1)"
+                " ON CONFLICT (user_id, period, key, tag) DO UPDATE SET"
+                " work = work + excluded.work,"
+                " pomodoros = pomodoros + 1",
+                [(self.user_id, period, keys[period], tag, duration) for period in PERIODS],
+            )
+        return cursor.lastrowid
+
+    def rollup(self, period, key):
+        """Агрегированные счётчики за период по ключу (поиск по первичному ключу)"""
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT work, break, pomodoros FROM rollups"
+                " WHERE user_id = ? AND period = ? AND key = ?",
+                (self.user_id, period, key),
+            ).fetchone()
+        if row is None:
+            return empty_stats()
+        return {"work": row[0], "break": row[1], "pomodoros": row[2]}
+
+    def current_stats(self, timestamp):
+        """Счётчики за день, неделю и месяц, содержащие момент времени"""
+        keys = period_keys(timestamp)
+        return tuple(self.rollup(period, keys[period]) for period in PERIODS)
+
+    def tag_rollup(self, period, key):
+        """Рабочее время и число помодоро по тегам за период: {тег: {"work", "pomodoros"}}"""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT tag, work, pomodoros FROM tag_rollups"
+                " WHERE user_id = ? AND period = ? AND key = ? ORDER BY tag",
+                (self.user_id, period, key),
+            ).fetchall()
+        return {tag: {"work": work, "pomodoros": pomodoros} for tag, work, pomodoros in rows}
+
+    def current_tag_stats(self, timestamp):
+        """Время по тегам за день, неделю и месяц, содержащие момент времени"""
+        keys = period_keys(timestamp)
+        return tuple(self.tag_rollup(period, keys[period]) for period in PERIODS)
+
+    def sessions(self, period, key):
+        """Сессии за период в порядке завершения"""
+        if period not in PERIODS:
+            raise ValueError(f"Неизвестный период: {period}")
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT id, kind, tag, started_at, ended_at, duration FROM sessions"
+                f" WHERE user_id = ? AND {period} = ? ORDER BY ended_at",
+                (self.user_id, key),
+            ).fetchall()
+
+    def iter_sessions(self, after_id=0, batch=1000):
+        """Сессии с id больше after_id по порядку id, порциями по batch строк.
+
+        Генератор: в памяти держится одна порция, сколько бы ни было сессий.
+        """
+        while True:
+            with self.pool.connection() as conn:
+                rows = conn.execute(
+                    "SELECT id, kind, tag, started_at, ended_at, duration, distraction FROM sessions"
+                    " WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?",
+                    (self.user_id, after_id, batch),
+                ).fetchall()
+            yield from rows
+            if len(rows) < batch:
+                return
+            after_id = rows[-1][0]
+
+    def last_id(self):
+        """id последней добавленной сессии пользователя (0, если журнал пуст).
+
+        Журнал только дополняется, поэтому это номер версии его данных.
+        """
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT MAX(id) FROM sessions WHERE user_id = ?", (self.user_id,)).fetchone()
+        return row[0] or 0
+
+    def span(self):
+        """Время окончания первой и последней сессии: (first, last) или None"""
+        with self.pool.connection() as conn:
+            first = conn.execute(
+                "SELECT MIN(ended_at) FROM sessions WHERE user_id = ?", (self.user_id,)
+            ).fetchone()[0]
+            last = conn.execute(
+                "SELECT MAX(ended_at) FROM sessions WHERE user_id = ?", (self.user_id,)
+            ).fetchone()[0]
+        return None if first is None else (first, last)
+
+    def daily_totals(self, start, end):
+        """Итоги по дням для сессий, завершённых в [start, end): [(день, работа, отдых, помодоро)]"""
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT day,"
+                " SUM(CASE WHEN kind = 'work' THEN duration ELSE 0 END),"
+                " SUM(CASE WHEN kind = 'work' THEN 0 ELSE duration END),"
+                " SUM(kind = 'work')"
+                " FROM sessions WHERE user_id = ? AND ended_at >= ? AND ended_at < ?"
+                " GROUP BY day ORDER BY day",
+                (self.user_id, start, end),
+            ).fetchall()
+
+    def tag_totals(self, start, end):
+        """Рабочее время по тегам для сессий, завершённых в [start, end): [(тег, работа, помодоро)].
+
+        Сессии без тега идут с тегом None.
+        """
+        with self.pool.connection() as conn:
+            return conn.execute(
+                "SELECT tag, SUM(duration), COUNT(*) FROM sessions"
+                " WHERE user_id = ? AND kind = 'work' AND ended_at >= ? AND ended_at < ?"
+                " GROUP BY tag ORDER BY tag",
+                (self.user_id, start, end),
+            ).fetchall()
+
+    def columns(self, since=None):
+        """Сессии пользователя (завершённые после since) в столбцах SessionColumns"""
+        query = "SELECT kind, tag, started_at, ended_at, duration FROM sessions WHERE user_id = ?"
+        params = [self.user_id]
+        if since is not None:
+            query += " AND ended_at > ?"
+            params.append(since)
+        columns = SessionColumns()
+        with self.pool.connection() as conn:
+            for row in conn.execute(query + " ORDER BY ended_at", params):
+                columns.append(*row)
+        return columns
+
+    def close(self):
+        if self._owns_pool:
+            self.pool.close()
@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import threading
+
+from persistence import atomic_write_json, open_log, read_json
+
+STATE_LOG_FILE = "pomodoro_state.log"
+STATE_SNAPSHOT_FILE = "pomodoro_state.json"
+SNAPSHOT_EVERY = 64  # записей журнала между снимками
+TAIL_BYTES = 4096  # хвост журнала, в котором ищется последняя целая запись
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS running_state (
+    user_id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    state TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
+class StateJournal:
+    """Журнал переходов состояния таймера (write-ahead log) со снимками.
+
+    Каждая запись — полное состояние сессии после перехода с номером seq,
+    дописывается строкой JSON и сразу fsync-ается, поэтому переживает
+    аварийное завершение. Каждые snapshot_every записей состояние пишется
+    атомарным снимком, а журнал обрезается. При загрузке читается снимок и
+    только хвост журнала: берётся последняя целая запись, оборванная при
+    сбое строка пропускается. Время восстановления не зависит от истории.
+    """
+
+    def __init__(self, path=STATE_LOG_FILE, snapshot_path=STATE_SNAPSHOT_FILE, snapshot_every=SNAPSHOT_EVERY):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self.snapshot_every = snapshot_every
+        self._lock = threading.Lock()
+        self._file = None
+        self._records = 0  # записей в журнале после последнего снимка
+        self._seq = None  # номер последней записи; читается с диска перед первой записью
+
+    def _last_record(self):
+        """Последняя целая запись из хвоста журнала (или None)"""
+        try:
+            with open(self.path, "rb") as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - TAIL_BYTES))
+                tail = f.read()
+        except FileNotFoundError:
+            return None
+        lines = tail.split(b"\n")
+        if size > TAIL_BYTES:
+            lines = lines[1:]  # первая строка хвоста может быть неполной
+        for line in reversed(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and "seq" in record:
+                return record
+        return None
+
+    def _latest(self):
+        """Самая свежая запись из снимка и журнала; вызывается под блокировкой"""
+        snapshot = read_json(self.snapshot_path)
+        latest = snapshot if isinstance(snapshot, dict) and "seq" in snapshot else None
+        record = self._last_record()
+        if record is not None and (latest is None or record["seq"] > latest["seq"]):
+            latest = record
+        self._seq = max(self._seq or 0, latest["seq"] if latest is not None else 0)
+        return latest
+
+    def load(self):
+        """Последнее сохранённое состояние сессии (или None)"""
+        with self._lock:
+            latest = self._latest()
+        if latest is None:
+            return None
+        state = dict(latest)
+        del state["seq"]
+        return state
+
+    def append(self, state):
+        """Запись перехода; раз в snapshot_every записей журнал сворачивается в снимок"""
+        with self._lock:
+            if self._seq is None:
+                self._latest()
+            self._seq += 1
+            record = dict(state, seq=self._seq)
+            if self._records + 1 >= self.snapshot_every:
+                self._snapshot(record)
+                return
+            if self._file is None:
+                self._file = open_log(self.path, TAIL_BYTES)
+            self._file.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._records += 1
+
+    def snapshot(self, state):
+        """Снимок состояния с обрезкой журнала"""
+        with self._lock:
+            if self._seq is None:
+                self._latest()
+            self._seq += 1
+            self._snapshot(dict(state, seq=self._seq))
+
+    def _snapshot(self, record):
+        # Сначала снимок, затем обрезка: при сбое между ними запись с большим seq уже в снимке
+        atomic_write_json(self.snapshot_path, record)
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self.path, "wb")
+        self._records = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class SqliteStateJournal:
+    """Состояние сессии пользователя user_id в общей базе SQLite.
+
+    Переход — одна замена строки в транзакции; надёжность даёт журнал WAL
+    самой базы, поэтому отдельные снимки не нужны.
+    """
+
+    def __init__(self, user_id, pool):
+        self.user_id = user_id
+        self.pool = pool
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def load(self):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT state FROM running_state WHERE user_id = ?", (self.user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            return json.loads(row[0])
+        except ValueError:
+            logger.error("Повреждённое состояние сессии пользователя %s", self.user_id)
+            return None
+
+    def append(self, state):
+        with self.pool.connection() as conn:
+            conn.execute(
+                "INSERT INTO running_state (user_id, seq, state) VALUES (?, 1, ?)"
+                " ON CONFLICT (user_id) DO UPDATE SET seq = seq + 1, state = excluded.state",
+                (self.user_id, json.dumps(state, ensure_ascii=False)),
+            )
+
+    snapshot = append
+
+    def close(self):
+        pass
@@ -0,0 +1,110 @@
+import threading
+
+EARN = "earn"
+SPEND = "spend"
+ADJUST = "adjust"
+
+
+class PointsLedger:
+    """Журнал начислений и списаний очков.
+
+    Записи только добавляются, баланс хранится готовым, поэтому его чтение не
+    зависит от длины истории. Списание проверяет баланс и уменьшает его под
+    одной блокировкой, так что параллельные покупки не уводят баланс в минус.
+    on_entry вызывается для каждой новой записи уже после снятия блокировки,
+    чтобы обработчик мог брать свои блокировки и читать журнал; при
+    параллельных вызовах порядок on_entry может не совпадать с порядком id.
+    """
+
+    def __init__(self, entries=(), on_entry=None):
+        self._lock = threading.Lock()
+        self._entries = [dict(entry) for entry in entries]
+        self._balance = sum(self._signed(entry) for entry in self._entries)
+        self._next_id = max((entry["id"] for entry in self._entries), default=0) + 1
+        self.on_entry = on_entry
+
+    @staticmethod
+    def _signed(entry):
+        return -entry["amount"] if entry["kind"] == SPEND else entry["amount"]
+
+    @property
+    def balance(self):
+        return self._balance
+
+    @property
+    def last_id(self):
+        """id последней записи (0, если записей нет); растёт с каждой новой записью"""
+        return self._next_id - 1
+
+    def _append(self, kind, amount, reason, timestamp):
+        """Добавление записи; вызывается под блокировкой, on_entry вызывает _notify после её снятия"""
+        entry = {"id": self._next_id, "kind": kind, "amount": amount, "reason": reason, "time": timestamp}
+        self._next_id += 1
+        self._entries.append(entry)
+        self._balance += self._signed(entry)
+        return entry
+
+    def _notify(self, entries):
+        if self.on_entry is not None:
+            for entry in entries:
+                self.on_entry(dict(entry))
+
+    def earn(self, amount, reason, timestamp):
+        """Начисление очков"""
+        with self._lock:
+            entry = self._append(EARN, amount, reason, timestamp)
+        self._notify((entry,))
+        return entry
+
+    def spend(self, amount, reason, timestamp):
+        """Атомарное списание: запись или None, если очков не хватает"""
+        with self._lock:
+            if self._balance < amount:
+                return None
+            entry = self._append(SPEND, amount, reason, timestamp)
+        self._notify((entry,))
+        return entry
+
+    def adjust(self, amount, reason, timestamp):
+        """Корректировка баланса (например, перенос баланса без истории)"""
+        with self._lock:
+            entry = self._append(ADJUST, amount, reason, timestamp)
+        self._notify((entry,))
+        return entry
+
+    def merge(self, entries):
+        """Добавление записей с другого устройства, которых ещё нет в журнале.
+
+        id у устройств свои, поэтому запись узнаётся по виду, сумме, причине и
+        времени; новые записи получают местные id. Возвращает число добавленных.
+        """
+        added = []
+        with self._lock:
+            known = {self._key(entry) for entry in self._entries}
+            for entry in entries:
+                key = self._key(entry)
+                if key not in known:
+                    known.add(key)
+                    added.append(self._append(entry["kind"], entry["amount"], entry["reason"], entry["time"]))
+        self._notify(added)
+        return len(added)
+
+    @staticmethod
+    def _key(entry):
+        return entry["kind"], entry["amount"], entry["reason"], entry["time"]
+
+    def entries(self, since_id=0):
+        """Записи с id больше since_id"""
+        with self._lock:
+            return [dict(entry) for entry in self._entries if entry["id"] > since_id]
+
+    def purchases(self, limit=None):
+        """Последние покупки, новые первыми"""
+        spent = []
+        with self._lock:
+            for entry in reversed(self._entries):
+                if limit is not None and len(spent) >= limit:
+                    break
+                if entry["kind"] == SPEND:
+                    spent.append(dict(entry))
+        return spent
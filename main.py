@@ -1,206 +1,170 @@
+import asyncio
 import flet as ft
-import json
-import time
-from datetime import datetime, timedelta
-import os
+import sys
+import threading
+import uuid
+from datetime import datetime
+
+from activity import ActivitySampler, configured_interval
+from analytics import HistoryAnalytics, last_weeks
+from events import (
+    BREAK_STARTED, POINTS_CHANGED, SESSION_COMPLETED, SESSION_PAUSED, SESSION_RESET, SESSION_STARTED,
+    SETTINGS_CHANGED, STATS_CHANGED, TICK,
+)
+from metrics import REGISTRY, instrument_connection, instrument_interface, start_http_server
+from persistence import default_io_executor
+from pomodoro import TAG_COLORS, create_timer
+from reports import REPORT_TITLES, default_report_pool, report_range
+from scheduler import default_scheduler, run_timer
+from shop import ShopSearchIndex
+
+PURCHASES_SHOWN = 10
+SHOP_PAGE_SIZE = 50  # карточек товаров за одну подгрузку
+SHOP_SCROLL_THRESHOLD = 200  # пикселей до конца списка, с которых подгружается следующая порция
+SETTINGS_DEBOUNCE = 0.5  # секунды без ввода, после которых применяются настройки
+HEATMAP_WEEKS = 20  # недель в тепловой карте
+TREND_WEEKS = 4  # недель в динамике по тегам
+HEATMAP_COLORS = ("grey200", "green100", "green300", "green500", "green700")
+REPORT_PERIODS = {"12": "12 месяцев", "36": "3 года", "all": "Вся история"}
+
+# События таймера, после которых интерфейс сверяет привязанные контролы
+INTERFACE_EVENTS = (
+    TICK, SESSION_STARTED, SESSION_PAUSED, SESSION_RESET, SESSION_COMPLETED,
+    BREAK_STARTED, POINTS_CHANGED, SETTINGS_CHANGED, STATS_CHANGED,
+)
+
+
+class ViewBindings:
+    """Привязки контролов к полям таймера.
+
+    Каждая привязка помнит последнее показанное значение, поэтому при синхронизации
+    отправляются только контролы, чьи данные действительно изменились.
+    """
 
-class PomodoroTimer:
     def __init__(self):
-        # Основные настройки таймера по умолчанию
-        self.work_time = 25 * 60  # 25 минут в секундах
-        self.break_time = 5 * 60  # 5 минут в секундах
-        self.long_break_time = 15 * 60  # 15 минут длинного перерыва
-        self.sessions_before_long_break = 4
-        
-        # Текущее состояние
-        self.current_time = self.work_time
-        self.is_running = False
-        self.is_work_time = True
-        self.session_count = 0
-        self.total_pomodoros = 0
-        
-        # Статистика
-        self.daily_stats = {"work": 0, "break": 0, "pomodoros": 0}
-        self.weekly_stats = {"work": 0, "break": 0, "pomodoros": 0}
-        self.monthly_stats = {"work": 0, "break": 0, "pomodoros": 0}
-        
-        # Пользовательские данные
-        self.tags = [
-            {"name": "Работа", "color": ft.Colors.RED},
-            {"name": "Учеба", "color": ft.Colors.BLUE},
-            {"name": "Личное", "color": ft.Colors.GREEN}
-        ]
-        self.current_tag = "Работа"
-        self.points = 0
-        self.shop_items = [
-            {"name": "1 час игры", "cost": 100, "description": "1 час игры на ПК"},
-            {"name": "Кофе-брейк", "cost": 50, "description": "15 минут перерыва с кофе"},
-            {"name": "Вечер кино", "cost": 200, "description": "Вечер просмотра фильма"}
-        ]
-        
-        # Настройки темы
-        self.themes = {
-            "light": {
-                "primary": ft.Colors.BLUE,
-                "background": ft.Colors.WHITE,
-                "surface": ft.Colors.GREY_100,
-                "on_primary": ft.Colors.WHITE,
-                "on_background": ft.Colors.BLACK,
-                "on_surface": ft.Colors.BLACK
-            },
-            "dark": {
-                "primary": ft.Colors.BLUE_700,
-                "background": ft.Colors.BLACK,
-                "surface": ft.Colors.GREY_900,
-                "on_primary": ft.Colors.WHITE,
-                "on_background": ft.Colors.WHITE,
-                "on_surface": ft.Colors.WHITE
-            },
-            "purple": {
-                "primary": ft.Colors.PURPLE,
-                "background": ft.Colors.PURPLE_50,
-                "surface": ft.Colors.PURPLE_100,
-                "on_primary": ft.Colors.WHITE,
-                "on_background": ft.Colors.BLACK,
-                "on_surface": ft.Colors.BLACK
-            },
-            "blue": {
-                "primary": ft.Colors.BLUE,
-                "background": ft.Colors.BLUE_50,
-                "surface": ft.Colors.BLUE_100,
-                "on_primary": ft.Colors.WHITE,
-                "on_background": ft.Colors.BLACK,
-                "on_surface": ft.Colors.BLACK
-            },
-            "green": {
-                "primary": ft.Colors.GREEN,
-                "background": ft.Colors.GREEN_50,
-                "surface": ft.Colors.GREEN_100,
-                "on_primary": ft.Colors.WHITE,
-                "on_background": ft.Colors.BLACK,
-                "on_surface": ft.Colors.BLACK
-            }
-        }
-        self.current_theme = "light"
-        
-        # Загрузка данных
-        self.load_data()
-
-    def format_time(self, seconds):
-        """Форматирование времени в MM:SS"""
-        minutes = seconds // 60
-        seconds = seconds % 60
-        return f"{minutes:02d}:{seconds:02d}"
-
-    def start_timer(self):
-        """Запуск таймера"""
-        self.is_running = True
-
-    def pause_timer(self):
-        """Пауза таймера"""
-        self.is_running = False
-
-    def reset_timer(self):
-        """Сброс таймера"""
-        self.is_running = False
-        if self.is_work_time:
-            self.current_time = self.work_time
+        self._bindings = []
+
+    def bind(self, control, getter, apply):
+        """Привязка контрола: getter читает значение, apply переносит его в контрол"""
+        self._bindings.append([control, getter, apply, object()])
+
+    def sync(self, push=True):
+        """Применение изменившихся значений; возвращает список обновлённых контролов"""
+        changed = []
+        for binding in self._bindings:
+            control, getter, apply, last = binding
+            value = getter()
+            if value != last:
+                apply(control, value)
+                binding[3] = value
+                if control not in changed:
+                    changed.append(control)
+        if push:
+            for control in changed:
+                control.update()
+        return changed
+
+
+class Debouncer:
+    """Отложенный вызов fn: серия call() чаще чем раз в delay даёт один вызов после паузы.
+
+    Если объект создан в цикле событий (асинхронный режим), вызов планируется
+    в этом цикле через loop.call_later из любого потока, иначе — через threading.Timer.
+    """
+
+    def __init__(self, delay, fn):
+        self.delay = delay
+        self.fn = fn
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        self._generation = 0  # отложенный вызов выполняется, только если после него не было call()
+        self._pending = False
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def call(self):
+        with self._lock:
+            self._generation += 1
+            self._pending = True
+            generation = self._generation
+            if self._loop is None:
+                if self._timer is not None:
+                    self._timer.cancel()
+                self._timer = threading.Timer(self.delay, self._fire, (generation,))
+                self._timer.daemon = True
+                self._timer.start()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.call_later, self.delay, self._fire, generation)
+
+    def _fire(self, generation):
+        with self._lock:
+            if generation != self._generation or not self._pending:
+                return
+            self._pending = False
+            self._timer = None
+        self.fn()
+
+    def flush(self):
+        """Немедленный вызов, если он ожидает"""
+        with self._lock:
+            pending, self._pending = self._pending, False
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+        if pending:
+            self.fn()
+
+
+def sync_handler(fn, blocking=False):
+    """Обработчик событий как есть: Flet выполняет его в пуле потоков"""
+    return fn
+
+
+def async_handler(fn, blocking=False):
+    """Обёртка обработчика в корутину, чтобы Flet выполнял его в цикле событий сессии.
+
+    blocking — обработчик читает базу и не меняет таймер: он выполняется в пуле
+    потоков, чтобы не задерживать цикл событий, общий для всех сессий.
+    """
+    async def handler(e):
+        if blocking:
+            await asyncio.get_running_loop().run_in_executor(None, fn, e)
         else:
-            self.current_time = self.break_time
+            fn(e)
+    return handler
 
-    def toggle_timer(self):
-        """Переключение состояния таймера"""
-        if self.is_running:
-            self.pause_timer()
-        else:
-            self.start_timer()
-
-    def update_timer(self):
-        """Обновление таймера"""
-        if self.is_running:
-            self.current_time -= 1
-            if self.current_time <= 0:
-                self.complete_session()
-
-    def complete_session(self):
-        """Завершение сессии"""
-        if self.is_work_time:
-            # Завершение рабочей сессии
-            self.total_pomodoros += 1
-            self.session_count += 1
-            self.daily_stats["pomodoros"] += 1
-            self.daily_stats["work"] += self.work_time
-            self.points += 10  # Начисление очков за завершенный помодоро
-            
-            # Определение типа перерыва
-            if self.session_count % self.sessions_before_long_break == 0:
-                self.current_time = self.long_break_time
-            else:
-                self.current_time = self.break_time
-                
-            self.is_work_time = False
-        else:
-            # Завершение перерыва
-            self.daily_stats["break"] += self.break_time
-            self.current_time = self.work_time
-            self.is_work_time = True
-            
-        self.is_running = False
-
-    def add_tag(self, name, color):
-        """Добавление нового тега"""
-        self.tags.append({"name": name, "color": color})
 
-    def add_shop_item(self, name, cost, description):
-        """Добавление нового товара в магазин"""
-        self.shop_items.append({"name": name, "cost": cost, "description": description})
+def tracked_handler(handler, activity):
+    """Обёртка обработчиков, которая отмечает каждое действие пользователя для сэмплера активности"""
+    def wrap(fn, blocking=False):
+        def tracked(e):
+            activity.interaction()
+            fn(e)
+        return handler(tracked, blocking)
+    return wrap
 
-    def buy_item(self, item_index):
-        """Покупка товара из магазина"""
-        item = self.shop_items[item_index]
-        if self.points >= item["cost"]:
-            self.points -= item["cost"]
-            return True
-        return False
-
-    def set_theme(self, theme_name):
-        """Установка темы"""
-        self.current_theme = theme_name
-
-    def save_data(self):
-        """Сохранение данных в файл"""
-        data = {
-            "tags": self.tags,
-            "shop_items": self.shop_items,
-            "points": self.points,
-            "theme": self.current_theme,
-            "work_time": self.work_time,
-            "break_time": self.break_time,
-            "long_break_time": self.long_break_time,
-            "sessions_before_long_break": self.sessions_before_long_break
-        }
-        with open("pomodoro_data.json", "w") as f:
-            json.dump(data, f)
-
-    def load_data(self):
-        """Загрузка данных из файла"""
-        try:
-            if os.path.exists("pomodoro_data.json"):
-                with open("pomodoro_data.json", "r") as f:
-                    data = json.load(f)
-                    self.tags = data.get("tags", self.tags)
-                    self.shop_items = data.get("shop_items", self.shop_items)
-                    self.points = data.get("points", 0)
-                    self.current_theme = data.get("theme", "light")
-                    self.work_time = data.get("work_time", 25 * 60)
-                    self.break_time = data.get("break_time", 5 * 60)
-                    self.long_break_time = data.get("long_break_time", 15 * 60)
-                    self.sessions_before_long_break = data.get("sessions_before_long_break", 4)
-        except:
-            pass
 
-def main(page: ft.Page):
-    timer = PomodoroTimer()
+# Состояния приложения, в которых его окно видно и активно (веб и мобильные клиенты)
+ACTIVE_LIFECYCLE_STATES = (ft.AppLifecycleState.SHOW, ft.AppLifecycleState.RESUME)
+
+
+def build_interface(page: ft.Page, timer, handler=sync_handler, subscriptions=None):
+    """Построение интерфейса; возвращает функцию обновления изменившихся контролов.
+
+    В subscriptions добавляются подписки интерфейса на события таймера, чтобы
+    снять их при закрытии страницы, если таймер переживает её.
+    """
+
+    # Замеры сосредоточенности в рабочих сессиях: действия в интерфейсе и фокус окна.
+    # Страницы одного таймера делят его сэмплер
+    activity = timer.activity
+    activity_interval = configured_interval()
+    if activity is None and activity_interval is not None:
+        activity = ActivitySampler(timer, activity_interval)
+    if activity is not None:
+        handler = tracked_handler(handler, activity)
     
     # Элементы интерфейса
     time_display = ft.Text(
@@ -219,8 +183,8 @@ def main(page: ft.Page):
     points_text = ft.Text(f"Очки: {timer.points}", size=16, weight=ft.FontWeight.BOLD)
     
     # Кнопки управления таймером
-    start_pause_btn = ft.ElevatedButton("Старт", on_click=lambda _: toggle_timer())
-    reset_btn = ft.ElevatedButton("Сброс", on_click=lambda _: reset_timer())
+    start_pause_btn = ft.ElevatedButton("Старт", on_click=handler(lambda _: timer.toggle_timer()))
+    reset_btn = ft.ElevatedButton("Сброс", on_click=handler(lambda _: timer.reset_timer()))
     
     # Статистика
     stats_text = ft.Column()
@@ -233,95 +197,151 @@ def main(page: ft.Page):
     tag_dropdown = ft.Dropdown(
         label="Выберите тег",
         options=[],
-        on_change=on_tag_change
-    )
-    
-    def on_work_time_change(e):
-        try:
-            timer.work_time = int(work_time_field.value) * 60
-            if not timer.is_running and timer.is_work_time:
-                timer.current_time = timer.work_time
-            update_interface()
-        except:
-            pass
-
-    # Настройки времени
-    work_time_field = ft.TextField(
-        label="Время работы (мин)",
-        value=str(timer.work_time // 60),
-        on_change=on_work_time_change
+        on_change=handler(on_tag_change)
     )
     
-    def on_break_time_change(e):
-        try:
-            timer.break_time = int(break_time_field.value) * 60
-            if not timer.is_running and not timer.is_work_time:
-                timer.current_time = timer.break_time
-            update_interface()
-        except:
-            pass
-
-    break_time_field = ft.TextField(
-        label="Время перерыва (мин)",
-        value=str(timer.break_time // 60),
-        on_change=on_break_time_change
-    )
-    
-    # Магазин
-    shop_items_column = ft.Column()
+    # Настройки времени: ввод копится и применяется одной проверенной правкой после паузы
+    settings_fields = {}  # ключ настройки -> (поле, множитель для перевода в единицы таймера)
+
+    def settings_field(key, label, scale=1):
+        field = ft.TextField(
+            label=label,
+            value=str(getattr(timer, key) // scale),
+            keyboard_type=ft.KeyboardType.NUMBER,
+            on_change=handler(lambda e: settings_input.call())
+        )
+        settings_fields[key] = (field, scale)
+        return field
+
+    def apply_settings():
+        """Разбор и проверка всех полей; настройки меняются, только если верны все"""
+        values = {}
+        errors = {}
+        for key, (field, scale) in settings_fields.items():
+            try:
+                values[key] = int(field.value) * scale
+            except (TypeError, ValueError):
+                errors[key] = "Введите целое число"
+        for key, (low, high) in timer.settings_errors(**values).items():
+            errors[key] = f"От {low // settings_fields[key][1]} до {high // settings_fields[key][1]}"
+        if not errors:
+            timer.update_settings(**values)
+        # Отправляются только поля, у которых сменилось сообщение об ошибке
+        for key, (field, scale) in settings_fields.items():
+            error_text = errors.get(key)
+            if (field.error_text or None) != error_text:
+                field.error_text = error_text
+                field.update()
+
+    settings_input = Debouncer(SETTINGS_DEBOUNCE, apply_settings)
+    work_time_field = settings_field("work_time", "Время работы (мин)", 60)
+    break_time_field = settings_field("break_time", "Время перерыва (мин)", 60)
+    long_break_time_field = settings_field("long_break_time", "Длинный перерыв (мин)", 60)
+    sessions_field = settings_field("sessions_before_long_break", "Сессий до длинного перерыва")
     
-    # Добавление нового товара
-    new_item_name = ft.TextField(label="Название товара")
-    new_item_cost = ft.TextField(label="Стоимость")
-    new_item_desc = ft.TextField(label="Описание")
+    # Магазин: карточки привязаны к постоянным id товаров и создаются только
+    # для показанной части списка; поиск идёт по индексу, а не по карточкам
+    shop_index = ShopSearchIndex(timer.shop_items)
+    shop_cards = {}  # id товара -> карточка
+    shop_matches = []  # id товаров, подходящих под поиск
+    shop_shown = SHOP_PAGE_SIZE
+
+    def on_shop_search(e):
+        nonlocal shop_shown
+        shop_shown = SHOP_PAGE_SIZE
+        show_shop_items()
+
+    def on_shop_scroll(e):
+        # Следующая порция карточек подгружается у конца списка
+        nonlocal shop_shown
+        if e.pixels >= e.max_scroll_extent - SHOP_SCROLL_THRESHOLD and shop_shown < len(shop_matches):
+            shop_shown += SHOP_PAGE_SIZE
+            render_shop_items()
+            shop_list.update()
+
+    shop_search = ft.TextField(label="Поиск товаров", on_change=handler(on_shop_search))
+    shop_list = ft.ListView(expand=True, spacing=10, on_scroll=handler(on_shop_scroll))
+    purchases_column = ft.Column()
     
     def on_theme_change(e):
         timer.set_theme(theme_radio.value)
-        update_interface()
 
     # Темы
     theme_radio = ft.RadioGroup(
         content=ft.Column(),
-        on_change=on_theme_change
+        on_change=handler(on_theme_change)
     )
 
     def update_interface():
-        """Обновление интерфейса"""
-        # Обновление времени
-        time_display.value = timer.format_time(timer.current_time)
-        
-        # Обновление статуса
-        status_text.value = "Рабочее время" if timer.is_work_time else "Перерыв"
-        status_text.color = ft.Colors.RED if timer.is_work_time else ft.Colors.GREEN
-        
-        # Обновление текста кнопки
-        start_pause_btn.text = "Пауза" if timer.is_running else "Старт"
-        
-        # Обновление тега и очков
-        tag_text.value = f"Тег: {timer.current_tag}"
-        points_text.value = f"Очки: {timer.points}"
-        
-        # Обновление статистики
-        update_stats()
-        
-        # Обновление темы
-        apply_theme()
-        
+        """Обновление интерфейса: отправляются только изменившиеся контролы"""
+        bindings.sync()
+
+    def refresh_page():
+        """Полное обновление страницы после изменения структуры контролов"""
+        bindings.sync(push=False)
         page.update()
 
-    def update_stats():
-        """Обновление отображения статистики"""
-        stats_text.controls.clear()
+    def set_status(control, is_work_time):
+        control.value = "Рабочее время" if is_work_time else "Перерыв"
+        control.color = ft.Colors.RED if is_work_time else ft.Colors.GREEN
+
+    def set_value(control, value):
+        control.value = value
+
+    def stat_text(getter, template, **kwargs):
+        """Строка статистики, привязанная к счётчику таймера"""
+        control = ft.Text(**kwargs)
+        bindings.bind(control, getter, lambda c, v: set_value(c, template.format(v)))
+        return control
+
+    def set_tag_stats(control, tag_stats):
+        control.controls = [
+            ft.Text(f"{name}: {stats['work'] // 60} мин, помодоро: {stats['pomodoros']}", size=13)
+            for name, stats in sorted(tag_stats.items(), key=lambda pair: -pair[1]["work"])
+        ]
+
+    def tag_stats_column(getter):
+        """Время по тегам за период; колонка пересобирается, только когда меняются счётчики"""
+        control = ft.Column(spacing=2)
+        bindings.bind(control, getter, set_tag_stats)
+        return control
+
+    def build_stats():
+        """Построение панели статистики (один раз, дальше обновляются только значения)"""
         stats_text.controls.extend([
             ft.Text("Статистика за день:", weight=ft.FontWeight.BOLD),
-            ft.Text(f"Помодоро: {timer.daily_stats['pomodoros']}"),
-            ft.Text(f"Работа: {timer.daily_stats['work'] // 60} мин"),
-            ft.Text(f"Перерывы: {timer.daily_stats['break'] // 60} мин"),
+            stat_text(lambda: timer.daily_stats['pomodoros'], "Помодоро: {}"),
+            stat_text(lambda: timer.daily_stats['work'] // 60, "Работа: {} мин"),
+            stat_text(lambda: timer.daily_stats['break'] // 60, "Перерывы: {} мин"),
+            tag_stats_column(lambda: timer.daily_tag_stats),
+            ft.Divider(),
+            ft.Text("За неделю:", weight=ft.FontWeight.BOLD),
+            stat_text(lambda: timer.weekly_stats['pomodoros'], "Помодоро: {}"),
+            stat_text(lambda: timer.weekly_stats['work'] // 60, "Работа: {} мин"),
+            tag_stats_column(lambda: timer.weekly_tag_stats),
+            ft.Text("За месяц:", weight=ft.FontWeight.BOLD),
+            stat_text(lambda: timer.monthly_stats['pomodoros'], "Помодоро: {}"),
+            stat_text(lambda: timer.monthly_stats['work'] // 60, "Работа: {} мин"),
+            tag_stats_column(lambda: timer.monthly_tag_stats),
             ft.Divider(),
             ft.Text("Общая статистика:", weight=ft.FontWeight.BOLD),
-            ft.Text(f"Всего помодоро: {timer.total_pomodoros}"),
-            ft.Text(f"Сессии: {timer.session_count}"),
+            stat_text(lambda: timer.total_pomodoros, "Всего помодоро: {}"),
+            stat_text(lambda: timer.session_count, "Сессии: {}"),
         ])
+        if activity is not None:
+            stats_text.controls.append(stat_text(
+                lambda: "нет замеров" if activity.last_score is None else f"{activity.last_score}%",
+                "Отвлечения в последней сессии: {}"
+            ))
+
+    bindings = ViewBindings()
+    bindings.bind(time_display, lambda: timer.format_time(timer.current_time), set_value)
+    bindings.bind(status_text, lambda: timer.is_work_time, set_status)
+    bindings.bind(start_pause_btn, lambda: timer.is_running,
+                  lambda c, running: setattr(c, "text", "Пауза" if running else "Старт"))
+    bindings.bind(tag_text, lambda: timer.current_tag, lambda c, v: set_value(c, f"Тег: {v}"))
+    bindings.bind(points_text, lambda: timer.points, lambda c, v: set_value(c, f"Очки: {v}"))
+    build_stats()
 
     def update_tag_dropdown():
         """Обновление выпадающего списка тегов"""
@@ -329,32 +349,62 @@ def main(page: ft.Page):
         for tag in timer.tags:
             tag_dropdown.options.append(
                 ft.dropdown.Option(
-                    text=tag["name"],
+                    text=tag.name,
                     # Flet пока не поддерживает прямой цвет для Dropdown
                 )
             )
         tag_dropdown.value = timer.current_tag
 
-    def update_shop_items():
-        """Обновление списка товаров в магазине"""
-        shop_items_column.controls.clear()
-        for i, item in enumerate(timer.shop_items):
-            shop_items_column.controls.append(
-                ft.Card(
-                    content=ft.Container(
-                        content=ft.Column([
-                            ft.Text(item["name"], weight=ft.FontWeight.BOLD),
-                            ft.Text(item["description"]),
-                            ft.Text(f"Стоимость: {item['cost']} очков"),
+    def shop_card(item):
+        """Карточка товара; создаётся один раз и переиспользуется при фильтрации"""
+        card = shop_cards.get(item.id)
+        if card is None:
+            item_id = item.id
+            card = shop_cards[item_id] = ft.Card(
+                key=str(item_id),
+                content=ft.Container(
+                    content=ft.Column([
+                        ft.Text(item.name, weight=ft.FontWeight.BOLD),
+                        ft.Text(item.description),
+                        ft.Text(f"Стоимость: {item.cost} очков"),
+                        ft.Row([
                             ft.ElevatedButton(
                                 "Купить",
-                                on_click=lambda e, idx=i: buy_shop_item(idx)
+                                on_click=handler(lambda e: buy_shop_item(item_id))
+                            ),
+                            ft.TextButton(
+                                "Удалить",
+                                on_click=handler(lambda e: remove_shop_item(item_id))
                             )
-                        ]),
-                        padding=10
-                    )
+                        ])
+                    ]),
+                    padding=10
                 )
             )
+        return card
+
+    def render_shop_items():
+        """Показ первых shop_shown найденных товаров; существующие карточки не пересоздаются"""
+        shop_list.controls = [
+            shop_card(timer.shop_item(item_id)) for item_id in shop_matches[:shop_shown]
+        ]
+
+    def show_shop_items(push=True):
+        """Повторный поиск и отправка изменившейся части списка"""
+        nonlocal shop_matches
+        shop_matches = shop_index.search(shop_search.value or "")
+        render_shop_items()
+        if push:
+            shop_list.update()
+
+    def update_purchases():
+        """Обновление истории последних покупок"""
+        purchases_column.controls.clear()
+        for entry in timer.ledger.purchases(limit=PURCHASES_SHOWN):
+            bought_at = datetime.fromtimestamp(entry["time"]).strftime("%d.%m %H:%M")
+            purchases_column.controls.append(
+                ft.Text(f"{bought_at} — {entry['reason']} (−{entry['amount']} очков)")
+            )
 
     def update_theme_selector():
         """Обновление выбора темы"""
@@ -365,9 +415,9 @@ def main(page: ft.Page):
             )
         theme_radio.value = timer.current_theme
 
-    def apply_theme():
+    def apply_theme(control, theme_name):
         """Применение выбранной темы"""
-        theme = timer.themes[timer.current_theme]
+        theme = timer.themes[theme_name]
         page.bgcolor = theme["background"]
         page.theme = ft.Theme(
             color_scheme=ft.ColorScheme(
@@ -380,57 +430,34 @@ def main(page: ft.Page):
             )
         )
 
-    def toggle_timer():
-        timer.toggle_timer()
-        update_interface()
-
-    def reset_timer():
-        timer.reset_timer()
-        update_interface()
-
-
-
-
-    def on_break_time_change(e):
-        try:
-            timer.break_time = int(break_time_field.value) * 60
-            if not timer.is_running and not timer.is_work_time:
-                timer.current_time = timer.break_time
-            update_interface()
-        except:
-            pass
-
-    def on_theme_change(e):
-        timer.set_theme(theme_radio.value)
-        update_interface()
+    # Тема пересобирается и отправляется только при смене current_theme
+    bindings.bind(page, lambda: timer.current_theme, apply_theme)
 
     def add_new_tag(e):
         """Добавление нового тега"""
         def save_tag(e):
             if new_tag_name.value and new_tag_color.value:
-                timer.add_tag(new_tag_name.value, new_tag_color.value)
+                if timer.add_tag(new_tag_name.value, new_tag_color.value) is None:
+                    page.show_snack_bar(ft.SnackBar(
+                        content=ft.Text(f"Тег '{new_tag_name.value}' уже есть"),
+                        action="OK"
+                    ))
+                    return
                 update_tag_dropdown()
                 timer.save_data()
                 page.dialog.open = False
-                update_interface()
+                refresh_page()
         
         new_tag_name = ft.TextField(label="Название тега")
         new_tag_color = ft.Dropdown(
             label="Цвет",
-            options=[
-                ft.dropdown.Option("RED"),
-                ft.dropdown.Option("BLUE"),
-                ft.dropdown.Option("GREEN"),
-                ft.dropdown.Option("PURPLE"),
-                ft.dropdown.Option("ORANGE"),
-                ft.dropdown.Option("YELLOW"),
-            ]
+            options=[ft.dropdown.Option(key=color, text=color.upper()) for color in TAG_COLORS]
         )
         
         page.dialog = ft.AlertDialog(
             title=ft.Text("Добавить новый тег"),
             content=ft.Column([new_tag_name, new_tag_color], tight=True),
-            actions=[ft.ElevatedButton("Сохранить", on_click=save_tag)]
+            actions=[ft.ElevatedButton("Сохранить", on_click=handler(save_tag))]
         )
         page.dialog.open = True
         page.update()
@@ -438,21 +465,21 @@ def main(page: ft.Page):
     def add_new_shop_item(e):
         """Добавление нового товара в магазин"""
         def save_item(e):
-            if (new_item_name.value and new_item_cost.value and 
-                new_item_desc.value):
+            if (new_item_name_local.value and new_item_cost_local.value and 
+                new_item_desc_local.value):
                 try:
-                    cost = int(new_item_cost.value)
-                    timer.add_shop_item(
-                        new_item_name.value, 
-                        cost, 
-                        new_item_desc.value
-                    )
-                    update_shop_items()
-                    timer.save_data()
-                    page.dialog.open = False
-                    update_interface()
-                except:
-                    pass
+                    cost = int(new_item_cost_local.value)
+                except ValueError:
+                    return
+                item = timer.add_shop_item(
+                    new_item_name_local.value, 
+                    cost, 
+                    new_item_desc_local.value
+                )
+                shop_index.add(item)
+                show_shop_items(push=False)
+                page.dialog.open = False
+                refresh_page()
         
         new_item_name_local = ft.TextField(label="Название товара")
         new_item_cost_local = ft.TextField(label="Стоимость")
@@ -465,19 +492,27 @@ def main(page: ft.Page):
                 new_item_cost_local, 
                 new_item_desc_local
             ], tight=True),
-            actions=[ft.ElevatedButton("Сохранить", on_click=save_item)]
+            actions=[ft.ElevatedButton("Сохранить", on_click=handler(save_item))]
         )
         page.dialog.open = True
         page.update()
 
-    def buy_shop_item(item_index):
+    def remove_shop_item(item_id):
+        """Удаление товара: из списка убирается только его карточка"""
+        if timer.remove_shop_item(item_id):
+            shop_index.remove(item_id)
+            shop_cards.pop(item_id, None)
+            show_shop_items()
+
+    def buy_shop_item(item_id):
         """Покупка товара из магазина"""
-        if timer.buy_item(item_index):
-            update_interface()
-            timer.save_data()
+        item = timer.shop_item(item_id)
+        if timer.buy_item(item_id):
+            update_purchases()
+            purchases_column.update()
             # Показать сообщение об успешной покупке
             page.show_snack_bar(ft.SnackBar(
-                content=ft.Text(f"Товар '{timer.shop_items[item_index]['name']}' куплен!"),
+                content=ft.Text(f"Товар '{item.name}' куплен!"),
                 action="OK"
             ))
         else:
@@ -518,10 +553,12 @@ def main(page: ft.Page):
                         ft.Text("Настройки времени:", weight=ft.FontWeight.BOLD),
                         work_time_field,
                         break_time_field,
+                        long_break_time_field,
+                        sessions_field,
                         ft.Divider(),
                         ft.Text("Управление тегами:", weight=ft.FontWeight.BOLD),
                         tag_dropdown,
-                        ft.ElevatedButton("Добавить тег", on_click=add_new_tag),
+                        ft.ElevatedButton("Добавить тег", on_click=handler(add_new_tag)),
                         ft.Divider(),
                         ft.Text("Тема:", weight=ft.FontWeight.BOLD),
                         theme_radio
@@ -536,43 +573,405 @@ def main(page: ft.Page):
                     content=ft.Column([
                         ft.Text("Магазин мотивации", size=20, weight=ft.FontWeight.BOLD),
                         points_text,
-                        ft.ElevatedButton("Добавить товар", on_click=add_new_shop_item),
+                        ft.ElevatedButton("Добавить товар", on_click=handler(add_new_shop_item)),
+                        shop_search,
                         ft.Divider(),
-                        shop_items_column
-                    ]),
-                    padding=20
+                        shop_list,
+                        ft.Divider(),
+                        ft.Text("История покупок:", weight=ft.FontWeight.BOLD),
+                        purchases_column
+                    ], expand=True),
+                    padding=20,
+                    expand=True
                 )
             )
         ]
     )
+
+    # Аналитика по всему журналу: столбцы загружаются в фоне, отчёты кэшируются
+    analytics = HistoryAnalytics(timer.history, wall_clock=timer.wall_clock)
+    analytics_subscription = timer.events.subscribe(SESSION_COMPLETED, analytics.on_session_completed)
+    if subscriptions is not None:
+        subscriptions.append(analytics_subscription)
+    threading.Thread(target=analytics.preload, name="analytics-preload", daemon=True).start()
+    analytics_column = ft.Column(scroll=ft.ScrollMode.AUTO, expand=True)
+    analytics_shown = None  # отчёты, по которым построена вкладка
+
+    def heatmap_cell(day, minutes, top):
+        level = 0 if not minutes else 1 + min(3, minutes * 4 // (top + 1))
+        return ft.Container(
+            width=12, height=12, border_radius=2,
+            bgcolor=HEATMAP_COLORS[level],
+            tooltip=f"{day.strftime('%d.%m.%Y')}: {minutes} мин"
+        )
+
+    def render_analytics():
+        """Построение вкладки аналитики; без новых сессий отчёты берутся из кэша и вкладка не меняется"""
+        nonlocal analytics_shown
+        today = datetime.fromtimestamp(timer.wall_clock()).date()
+        first, last = last_weeks(today, HEATMAP_WEEKS)
+        reports = (
+            analytics.heatmap(first, last),
+            analytics.streaks(today),
+            analytics.hours(first, last),
+            analytics.tag_trends(*last_weeks(today, TREND_WEEKS)),
+        )
+        if analytics_shown is not None and all(a is b for a, b in zip(reports, analytics_shown)):
+            return False
+        analytics_shown = reports
+        heatmap, streaks, hours, trends = reports
+        days = list(heatmap.items())
+        top = max(heatmap.values(), default=0)
+        top_hour = max(hours) or 1
+        analytics_column.controls = [
+            ft.Text(f"Текущая серия: {streaks['current']} дн., лучшая: {streaks['longest']} дн.",
+                    weight=ft.FontWeight.BOLD),
+            ft.Divider(),
+            ft.Text(f"Минуты работы за {HEATMAP_WEEKS} недель:", weight=ft.FontWeight.BOLD),
+            ft.Row([
+                ft.Column([heatmap_cell(day, minutes, top) for day, minutes in days[week:week + 7]], spacing=2)
+                for week in range(0, len(days), 7)
+            ], spacing=2),
+            ft.Divider(),
+            ft.Text("По часам суток:", weight=ft.FontWeight.BOLD),
+            ft.Row([
+                ft.Container(
+                    width=10, height=max(1, 60 * minutes // top_hour),
+                    bgcolor="green500", tooltip=f"{hour:02d}:00 — {minutes} мин"
+                )
+                for hour, minutes in enumerate(hours)
+            ], spacing=2, vertical_alignment=ft.CrossAxisAlignment.END),
+            ft.Divider(),
+            ft.Text(f"Теги по неделям (последние {TREND_WEEKS}), мин:", weight=ft.FontWeight.BOLD),
+        ] + [
+            ft.Text(f"{name or 'Без тега'}: {' / '.join(str(minutes) for minutes in weeks)}")
+            for name, weeks in trends.items()
+        ]
+        return True
+
+    def on_tab_change(e):
+        if tabs.tabs[tabs.selected_index].content.content is analytics_column and render_analytics():
+            analytics_column.update()
+
+    tabs.tabs.append(
+        ft.Tab(
+            text="Аналитика",
+            icon=ft.Icons.INSIGHTS,
+            content=ft.Container(content=analytics_column, padding=20, expand=True)
+        )
+    )
+    tabs.on_change = handler(on_tab_change, blocking=True)
+
+    # Отчёты за долгие периоды строятся в общем пуле отчётов: обработчик только
+    # ставит задание, поэтому таймер и интерфейс обновляются и во время построения
+    report_pool = default_report_pool()
+    report_job = None
+    report_kind = ft.Dropdown(
+        label="Отчёт",
+        value="summary",
+        options=[ft.dropdown.Option(key, REPORT_TITLES[key]) for key in ("summary", "tags", "ledger")]
+    )
+    report_period = ft.Dropdown(
+        label="Период",
+        value="12",
+        options=[ft.dropdown.Option(key, text) for key, text in REPORT_PERIODS.items()]
+    )
+    report_progress = ft.ProgressBar(value=0, visible=False)
+    report_column = ft.Column(scroll=ft.ScrollMode.AUTO, expand=True)
+
+    def report_lines(kind, result):
+        if kind == "summary":
+            lines = [
+                f"{month['month']}: работа {month['work'] // 60} мин, помодоро {month['pomodoros']}, "
+                f"дней с работой {month['active_days']}"
+                for month in result["months"]
+            ]
+            total = result["total"]
+            lines.append(f"Всего: работа {total['work'] // 60} мин, помодоро {total['pomodoros']}")
+        elif kind == "tags":
+            lines = [
+                f"{tag or 'Без тега'}: {row['work'] // 60} мин, помодоро {row['pomodoros']} ({row['share']:.0%})"
+                for tag, row in result.items()
+            ]
+        else:
+            lines = [
+                f"Баланс: {result['balance']}, по записям: {result['closing']}"
+                + ("" if result["balanced"] else " — расхождение!"),
+                f"Наименьший баланс за период: {result['lowest']}",
+            ]
+            if result["mismatched"]:
+                lines.append(f"Начисления не сходятся с сессиями: {', '.join(result['mismatched'])}")
+        return [ft.Text(line) for line in lines or ["Нет данных за период"]]
+
+    def on_report_progress(completed, total):
+        report_progress.value = completed / total
+        report_progress.update()
+
+    def on_report_done(job):
+        # Вызывается в потоке пула отчётов
+        if job is not report_job:
+            return
+        build_report_btn.disabled = False
+        cancel_report_btn.disabled = True
+        report_progress.visible = False
+        if job.cancelled():
+            report_column.controls = [ft.Text("Отчёт отменён")]
+        elif job.future.exception() is not None:
+            report_column.controls = [ft.Text(f"Ошибка построения отчёта: {job.future.exception()}")]
+        else:
+            report_column.controls = report_lines(job.key[0], job.result())
+        report_tab.update()
+
+    def build_report(e):
+        nonlocal report_job
+        today = datetime.fromtimestamp(timer.wall_clock()).date()
+        months_back = None if report_period.value == "all" else int(report_period.value)
+        first, last = report_range(timer.history, today, months_back)
+        build_report_btn.disabled = True
+        cancel_report_btn.disabled = False
+        report_progress.value = 0
+        report_progress.visible = True
+        report_column.controls = [ft.Text("Отчёт строится...")]
+        report_tab.update()
+        report_job = report_pool.submit(report_kind.value, timer, first, last, on_progress=on_report_progress)
+        report_job.add_done_callback(on_report_done)
+
+    def cancel_report(e):
+        if report_job is not None:
+            report_job.cancel()
+
+    build_report_btn = ft.ElevatedButton("Построить", on_click=handler(build_report, blocking=True))
+    cancel_report_btn = ft.TextButton("Отменить", disabled=True, on_click=handler(cancel_report))
+    report_tab = ft.Column([
+        ft.Row([report_kind, report_period]),
+        ft.Row([build_report_btn, cancel_report_btn]),
+        report_progress,
+        ft.Divider(),
+        report_column
+    ], expand=True)
+
+    tabs.tabs.append(
+        ft.Tab(
+            text="Отчёты",
+            icon=ft.Icons.ASSESSMENT,
+            content=ft.Container(content=report_tab, padding=20, expand=True)
+        )
+    )
+
+    # Отладочная панель с метриками процесса (только при включённых метриках)
+    if REGISTRY.enabled:
+        metrics_text = ft.Text(REGISTRY.summary(), selectable=True, font_family="monospace", size=12)
+
+        def refresh_metrics(e):
+            metrics_text.value = REGISTRY.summary()
+            metrics_text.update()
+
+        tabs.tabs.append(
+            ft.Tab(
+                text="Отладка",
+                icon=ft.Icons.BUG_REPORT,
+                content=ft.Container(
+                    content=ft.Column([
+                        ft.ElevatedButton("Обновить", on_click=handler(refresh_metrics)),
+                        metrics_text
+                    ]),
+                    padding=20
+                )
+            )
+        )
     
     page.add(tabs)
     
     # Инициализация данных
     update_tag_dropdown()
-    update_shop_items()
+    show_shop_items(push=False)
+    update_purchases()
     update_theme_selector()
-    update_stats()
-    apply_theme()
-    
-    # Главный цикл таймера
-    def timer_tick():
-        while True:
-            timer.update_timer()
-            update_interface()
-            time.sleep(1)
-    
-    # Запуск таймера в отдельном потоке
-    import threading
-    timer_thread = threading.Thread(target=timer_tick, daemon=True)
-    timer_thread.start()
-    
+    refresh_page()
+
     # Сохранение данных при закрытии
     def on_window_event(e):
         if e.data == "close":
-            timer.save_data()
+            settings_input.flush()
+            timer.run_io(timer.flush_data)
+        elif e.data in ("focus", "blur") and activity is not None:
+            activity.focus(e.data == "focus")
     
-    page.on_window_event = on_window_event
+    page.window.on_event = handler(on_window_event)
+
+    # В браузере и на телефоне вместо фокуса окна приходят смены состояния приложения
+    def on_lifecycle_change(e):
+        if activity is not None:
+            activity.focus(e.state in ACTIVE_LIFECYCLE_STATES)
+
+    page.on_app_lifecycle_state_change = handler(on_lifecycle_change)
+
+    return update_interface
+
+
+USER_ID_KEY = "pomodoro.user_id"
+
+
+class LiveTimers:
+    """Таймеры открытых страниц процесса по пользователям.
+
+    Вкладки одного браузера получают один user_id. Отдельные таймеры вкладок
+    выдавали бы новым записям журнала очков и товарам одинаковые id, а баланс в
+    хранилище перезаписывала бы вкладка, сохранившаяся последней. Поэтому
+    страницы пользователя делят один таймер: его создаёт первая страница,
+    а тики останавливает и таймер закрывает последняя.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = {}  # user_id -> таймер
+        self._pages = {}  # user_id -> число открытых страниц
+        self._stops = {}  # user_id -> остановка тиков таймера
+
+    def acquire(self, user_id):
+        """Таймер пользователя для новой страницы; первый вызов загружает данные (блокирующий)"""
+        with self._lock:
+            if user_id not in self._timers:
+                self._timers[user_id] = create_timer(user_id)
+                self._pages[user_id] = 0
+            self._pages[user_id] += 1
+            return self._timers[user_id]
+
+    def start_ticks(self, user_id, start):
+        """Запуск тиков таймера, если они ещё не идут; start() возвращает функцию их остановки"""
+        with self._lock:
+            if user_id not in self._stops:
+                self._stops[user_id] = start()
+
+    def release(self, user_id):
+        """Страница закрыта; True — это была последняя страница, тики остановлены и таймер нужно закрыть"""
+        with self._lock:
+            self._pages[user_id] -= 1
+            if self._pages[user_id]:
+                return False
+            del self._timers[user_id], self._pages[user_id]
+            stop = self._stops.pop(user_id, None)
+        if stop is not None:
+            stop()
+        return True
+
+
+LIVE_TIMERS = LiveTimers()
+
+
+def main(page: ft.Page):
+    user_id = None
+    if page.web:
+        # В веб-режиме у каждого браузера свои данные
+        user_id = page.client_storage.get(USER_ID_KEY)
+        if not user_id:
+            user_id = uuid.uuid4().hex
+            page.client_storage.set(USER_ID_KEY, user_id)
+    timer = LIVE_TIMERS.acquire(user_id)
+    subscriptions = []
+    update_interface = instrument_interface(build_interface(page, timer, subscriptions=subscriptions))
+    if REGISTRY.enabled:
+        instrument_connection(page.connection)
+        start_http_server()
+
+    # Тики таймера выполняет общий для процесса планировщик: он будит сессию
+    # только на границах секунд и не тратит ресурсы на таймеры на паузе.
+    # Интерфейс обновляется по событиям таймера, которые публикует update_timer
+    scheduler = default_scheduler()
+
+    def start_ticks():
+        handle = scheduler.register(timer, timer.update_timer)
+        return lambda: scheduler.unregister(handle)
+
+    LIVE_TIMERS.start_ticks(user_id, start_ticks)
+    subscription = timer.events.subscribe(INTERFACE_EVENTS, lambda event: update_interface())
+
+    def unsubscribe():
+        nonlocal subscription
+        if subscription is not None:
+            timer.events.unsubscribe(subscription)
+            subscription = None
+
+    def on_connect(e):
+        nonlocal subscription
+        if subscription is None:
+            subscription = timer.events.subscribe(INTERFACE_EVENTS, lambda event: update_interface())
+
+    def on_disconnect(e):
+        unsubscribe()
+        timer.flush_data()
+
+    def on_close(e):
+        unsubscribe()
+        for page_subscription in subscriptions:
+            timer.events.unsubscribe(page_subscription)
+        if LIVE_TIMERS.release(user_id):
+            if timer.activity is not None:
+                timer.activity.close()
+            timer.close()
+
+    page.on_connect = on_connect
+    page.on_disconnect = on_disconnect
+    page.on_close = on_close
+
+
+async def main_async(page: ft.Page):
+    """Асинхронный вариант main: тики и обработчики работают в цикле событий сессии,
+    а блокирующие чтение и запись хранилищ — в пуле потоков"""
+    user_id = None
+    if page.web:
+        user_id = await page.client_storage.get_async(USER_ID_KEY)
+        if not user_id:
+            user_id = uuid.uuid4().hex
+            await page.client_storage.set_async(USER_ID_KEY, user_id)
+    loop = asyncio.get_running_loop()
+    timer = await loop.run_in_executor(None, LIVE_TIMERS.acquire, user_id)
+    # Журнал сессии, запись завершённых сессий и сброс данных идут по порядку в общем потоке
+    timer.io = default_io_executor()
+    subscriptions = []
+    update_interface = instrument_interface(
+        build_interface(page, timer, handler=async_handler, subscriptions=subscriptions)
+    )
+    if REGISTRY.enabled:
+        instrument_connection(page.connection)
+        start_http_server()
+
+    def start_ticks():
+        return asyncio.create_task(run_timer(timer)).cancel
+
+    # События публикуются в цикле событий сессии (тики и обработчики), поэтому
+    # интерфейс обновляется прямо в обработчике события
+    LIVE_TIMERS.start_ticks(user_id, start_ticks)
+    subscription = timer.events.subscribe(INTERFACE_EVENTS, lambda event: update_interface())
+
+    def unsubscribe():
+        nonlocal subscription
+        if subscription is not None:
+            timer.events.unsubscribe(subscription)
+            subscription = None
+
+    async def on_connect(e):
+        nonlocal subscription
+        if subscription is None:
+            subscription = timer.events.subscribe(INTERFACE_EVENTS, lambda event: update_interface())
+
+    async def on_disconnect(e):
+        unsubscribe()
+        await loop.run_in_executor(timer.io, timer.flush_data)
+
+    async def on_close(e):
+        unsubscribe()
+        for page_subscription in subscriptions:
+            timer.events.unsubscribe(page_subscription)
+        if LIVE_TIMERS.release(user_id):
+            if timer.activity is not None:
+                timer.activity.close()
+            await loop.run_in_executor(timer.io, timer.close)
+
+    page.on_connect = on_connect
+    page.on_disconnect = on_disconnect
+    page.on_close = on_close
+
 
 if __name__ == "__main__":
-    ft.app(target=main)
+    ft.app(target=main_async if "--async" in sys.argv else main)
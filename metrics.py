@@ -0,0 +1,259 @@
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+from events import POINTS_CHANGED, SESSION_COMPLETED, TICK
+from ledger import SPEND
+
+METRICS_ENV = "POMODORO_METRICS_PORT"
+METRICS_HOST = "127.0.0.1"
+
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+LATE_TICK = 0.1  # тик, пришедший позже границы секунды на столько, считается опоздавшим
+
+logger = logging.getLogger(__name__)
+
+
+class Counter:
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def expose(self):
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} counter",
+            f"{self.name} {self.value}",
+        ]
+
+
+class Histogram:
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def expose(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {count}')
+        lines.append(f"{self.name}_sum {total}")
+        lines.append(f"{self.name}_count {count}")
+        return lines
+
+
+class Registry:
+    """Набор метрик процесса.
+
+    Пока реестр выключен, instrument_* ничего не оборачивают, и горячие пути
+    работают без каких-либо дополнительных вызовов.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, *args)
+            return metric
+
+    def counter(self, name, help):
+        return self._get(Counter, name, help)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        return self._get(Histogram, name, help, buckets)
+
+    def expose(self):
+        """Метрики в текстовом формате Prometheus"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.expose())
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Краткая сводка для отладочной панели"""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            if isinstance(metric, Counter):
+                lines.append(f"{metric.name}: {metric.value}")
+            elif metric.count:
+                lines.append(f"{metric.name}: n={metric.count}, среднее={metric.sum / metric.count:.6f}")
+            else:
+                lines.append(f"{metric.name}: n=0")
+        return "\n".join(lines)
+
+
+REGISTRY = Registry(enabled=bool(os.environ.get(METRICS_ENV)))
+
+
+def timed(histogram, fn):
+    """Обёртка, записывающая длительность вызовов fn в гистограмму"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - started)
+    return wrapper
+
+
+def instrument_storage(storage, registry=REGISTRY):
+    """Замеры загрузки и записи хранилища (длительность и объём записанных данных)"""
+    if not registry.enabled:
+        return storage
+    storage.load = timed(
+        registry.histogram("pomodoro_load_data_seconds", "Длительность загрузки данных пользователя"),
+        storage.load,
+    )
+    write_seconds = registry.histogram("pomodoro_save_data_seconds", "Длительность записи данных пользователя")
+    write_bytes = registry.counter("pomodoro_write_bytes_total", "Объём записанных данных пользователя")
+    write = timed(write_seconds, storage.write)
+
+    def instrumented_write(snapshot, changes):
+        size = write(snapshot, changes)
+        if not isinstance(size, int):
+            size = len(json.dumps(changes, ensure_ascii=False).encode("utf-8"))
+        write_bytes.inc(size)
+        return size
+
+    storage.write = instrumented_write
+    return storage
+
+
+def instrument_timer(timer, registry=REGISTRY):
+    """Замеры тиков, опозданий, завершённых сессий и покупок таймера (по его событиям)"""
+    if not registry.enabled:
+        return timer
+    ticks = registry.counter("pomodoro_ticks_total", "Тики запущенных таймеров")
+    late_ticks = registry.counter("pomodoro_late_ticks_total", f"Тики, опоздавшие больше чем на {LATE_TICK} с")
+    lateness = registry.histogram("pomodoro_tick_lateness_seconds", "Опоздание тика относительно границы секунды")
+    completions = registry.counter("pomodoro_sessions_completed_total", "Завершённые сессии")
+    purchases = registry.counter("pomodoro_purchases_total", "Успешные покупки в магазине")
+    timer.update_timer = timed(
+        registry.histogram("pomodoro_update_timer_seconds", "Длительность update_timer"), timer.update_timer
+    )
+
+    def on_tick(event):
+        ticks.inc()
+        late = (1.0 - timer.remaining_time() % 1.0) % 1.0
+        lateness.observe(late)
+        if late > LATE_TICK:
+            late_ticks.inc()
+
+    def on_points_changed(event):
+        if event.data["entry"]["kind"] == SPEND:
+            purchases.inc()
+
+    timer.events.subscribe(TICK, on_tick)
+    timer.events.subscribe(SESSION_COMPLETED, lambda event: completions.inc())
+    timer.events.subscribe(POINTS_CHANGED, on_points_changed)
+    return timer
+
+
+def instrument_interface(update_interface, registry=REGISTRY):
+    """Замер длительности обновления интерфейса"""
+    if not registry.enabled:
+        return update_interface
+    return timed(
+        registry.histogram("pomodoro_update_interface_seconds", "Длительность update_interface"),
+        update_interface,
+    )
+
+
+def instrument_connection(connection, registry=REGISTRY):
+    """Замер размера каждой отправки изменений страницы клиенту (соединение Flet)"""
+    if not registry.enabled or connection is None or getattr(connection, "_pomodoro_instrumented", False):
+        return connection
+    from flet.core.protocol import CommandEncoder
+
+    sizes = registry.histogram("pomodoro_page_update_bytes", "Размер отправки изменений страницы", SIZE_BUCKETS)
+    send_commands = connection.send_commands
+
+    def instrumented_send_commands(session_id, commands):
+        payload = json.dumps(commands, cls=CommandEncoder, separators=(",", ":"))
+        sizes.observe(len(payload.encode("utf-8")))
+        return send_commands(session_id, commands)
+
+    connection.send_commands = instrumented_send_commands
+    connection._pomodoro_instrumented = True
+    return connection
+
+
+def metrics_handler(registry=REGISTRY):
+    """Класс обработчика /metrics для реестра registry.
+
+    http.server импортируется здесь, а не при импорте модуля: он нужен только
+    при включённых метриках, а metrics импортирует ядро таймера.
+    """
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.expose().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def start_http_server(port=None, host=METRICS_HOST, registry=REGISTRY):
+    """Локальная точка /metrics в формате Prometheus (один сервер на процесс)"""
+    global _server
+    with _server_lock:
+        if _server is None:
+            port = int(os.environ.get(METRICS_ENV, 0)) if port is None else port
+            from http.server import ThreadingHTTPServer
+
+            _server = ThreadingHTTPServer((host, port), metrics_handler(registry))
+            threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+            logger.info("Метрики доступны на http://%s:%s/metrics", host, _server.server_address[1])
+        return _server
@@ -0,0 +1,224 @@
+import heapq
+import itertools
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+DATA_FILE = "pomodoro_data.json"
+SAVE_INTERVAL = 1.0  # секунды между сбросами накопленных изменений
+
+logger = logging.getLogger(__name__)
+
+
+def atomic_write_json(path, data):
+    """Атомарная запись JSON: временный файл, fsync и переименование поверх старого.
+
+    Возвращает размер записанных данных в байтах.
+    """
+    payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".pomodoro-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # Фиксация переименования в каталоге (POSIX)
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+    return len(payload)
+
+
+def read_json(path):
+    """Чтение JSON-файла; повреждённый файл откладывается в сторону, а не теряется.
+
+    Возвращает None, если файла нет или его не удалось разобрать.
+    """
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as error:
+        broken_path = f"{path}.corrupt-{int(time.time())}"
+        logger.error("Не удалось прочитать %s (%s), файл сохранён как %s", path, error, broken_path)
+        try:
+            os.replace(path, broken_path)
+        except OSError:
+            pass
+        return None
+
+
+def open_log(path, chunk=4096):
+    """Открытие журнала из строк JSON на дозапись; оборванная при сбое последняя
+    строка отрезается, иначе следующая запись склеилась бы с ней и не читалась"""
+    f = open(path, "a+b")
+    size = end = f.seek(0, os.SEEK_END)
+    while end > 0:
+        start = max(0, end - chunk)
+        f.seek(start)
+        newline = f.read(end - start).rfind(b"\n")
+        if newline >= 0:
+            end = start + newline + 1
+            break
+        end = start
+    if end != size:
+        logger.warning("Оборванная запись в конце %s отброшена (%d байт)", path, size - end)
+        f.truncate(end)
+        f.flush()
+        os.fsync(f.fileno())
+    return f
+
+
+class Flusher:
+    """Общий для процесса поток фоновой записи.
+
+    Хранилища с несохранёнными изменениями стоят в куче по времени записи,
+    один поток выполняет записи по мере наступления сроков. Число потоков
+    не зависит от числа сессий.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def schedule(self, worker, delay):
+        """Запись worker через delay секунд"""
+        with self._condition:
+            heapq.heappush(self._heap, (self.clock() + delay, next(self._sequence), worker))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="persistence-flusher", daemon=True)
+                self._thread.start()
+            elif self._heap[0][2] is worker:
+                self._condition.notify()
+
+    def _next_due(self):
+        """Ближайшая к записи регистрация; вызывается под условием"""
+        while True:
+            if not self._heap:
+                self._condition.wait()
+                continue
+            delay = self._heap[0][0] - self.clock()
+            if delay > 0:
+                self._condition.wait(delay)
+                continue
+            return heapq.heappop(self._heap)[2]
+
+    def _run(self):
+        while True:
+            with self._condition:
+                worker = self._next_due()
+            worker._flush_due()
+
+
+_default_flusher = None
+_default_lock = threading.Lock()
+
+
+def default_flusher():
+    """Поток фоновой записи, общий для всех сессий процесса"""
+    global _default_flusher
+    with _default_lock:
+        if _default_flusher is None:
+            _default_flusher = Flusher()
+        return _default_flusher
+
+
+_io_executor = None
+
+
+def default_io_executor():
+    """Исполнитель блокирующих записей асинхронного режима, общий для процесса.
+
+    Один поток: записи журналов сессий выполняются в порядке отправки.
+    """
+    global _io_executor
+    with _default_lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pomodoro-io")
+        return _io_executor
+
+
+class PersistenceWorker:
+    """Фоновая запись состояния.
+
+    Изменения только помечают состояние «грязным»; общий поток записи
+    (Flusher) не чаще раза в interval снимает снимок через snapshot() и
+    передаёт его в write(), так что серия правок превращается в одну запись.
+    """
+
+    def __init__(self, snapshot, write, interval=SAVE_INTERVAL, flusher=None):
+        self.snapshot = snapshot
+        self.write = write
+        self.interval = interval
+        self.flusher = flusher if flusher is not None else default_flusher()
+        self._dirty = False
+        self._scheduled = False  # запись уже стоит в очереди общего потока
+        self._closed = False
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def mark_dirty(self):
+        """Пометка состояния как изменённого; запись произойдёт в фоне"""
+        with self._lock:
+            self._dirty = True
+            if self._scheduled or self._closed:
+                return
+            # Правки, пришедшие за интервал, попадут в ту же запись
+            self._scheduled = True
+        self.flusher.schedule(self, self.interval)
+
+    def flush(self):
+        """Немедленная запись, если есть несохранённые изменения"""
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return False
+                self._dirty = False
+            try:
+                self.write(self.snapshot())
+            except Exception:
+                with self._lock:
+                    self._dirty = True
+                raise
+            return True
+
+    def close(self):
+        """Отключение от фоновой записи с гарантированной записью последних изменений"""
+        with self._lock:
+            self._closed = True
+        self.flush()
+
+    def _flush_due(self):
+        """Запись по сроку; вызывается общим потоком записи"""
+        with self._lock:
+            self._scheduled = False
+            if self._closed:
+                return
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Ошибка фонового сохранения данных")
+            with self._lock:
+                if self._closed or self._scheduled:
+                    return
+                self._scheduled = True
+            self.flusher.schedule(self, self.interval)
@@ -0,0 +1,634 @@
+import math
+import threading
+import time
+
+from events import (
+    BREAK_STARTED, POINTS_CHANGED, SESSION_COMPLETED, SESSION_PAUSED, SESSION_RESET, SESSION_STARTED,
+    SETTINGS_CHANGED, STATS_CHANGED, TICK, EventBus,
+)
+from history import HISTORY_FILE, SessionLog, next_day
+from journal import SqliteStateJournal, StateJournal
+from ledger import PointsLedger
+from metrics import instrument_storage, instrument_timer
+from records import ShopItem
+from persistence import SAVE_INTERVAL, PersistenceWorker
+from storage import JsonFileStorage, SqliteStorage, shared_pool
+from tags import TagRegistry
+
+# Цвета хранятся строками в формате Flet, ядро от Flet не зависит
+TAG_COLORS = ("red", "blue", "green", "purple", "orange", "yellow")
+
+POINTS_PER_POMODORO = 10
+POMODORO_REASON = "Помодоро"  # причина начисления очков за завершённый помодоро
+
+# Допустимые значения настроек (длительности в секундах)
+SETTINGS_LIMITS = {
+    "work_time": (60, 180 * 60),
+    "break_time": (60, 60 * 60),
+    "long_break_time": (60, 120 * 60),
+    "sessions_before_long_break": (1, 12),
+}
+
+# Разделы данных, в которых изменения — это добавленные записи
+APPENDED_SECTIONS = ("tags", "shop_items", "shop_items_removed", "ledger")
+
+
+def is_long_break(session_count, sessions_before_long_break):
+    """Положен ли длинный перерыв после session_count рабочих сессий"""
+    return session_count > 0 and session_count % sessions_before_long_break == 0
+
+
+def session_outcome(is_work_time, session_count, work_time, break_time, long_break_time,
+                    sessions_before_long_break):
+    """Правила завершения сессии, общие для таймера и пакетной симуляции.
+
+    Возвращает (вид, длительность, начисленные очки, счётчик рабочих сессий после неё).
+    """
+    if is_work_time:
+        return "work", work_time, POINTS_PER_POMODORO, session_count + 1
+    if is_long_break(session_count, sessions_before_long_break):
+        return "long_break", long_break_time, 0, session_count
+    return "break", break_time, 0, session_count
+
+
+class SettingsError(ValueError):
+    """Недопустимые настройки; errors — ключ настройки -> допустимый диапазон (или None)"""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(
+            f"{key}: от {limits[0]} до {limits[1]}" if limits else f"{key}: недопустимое значение"
+            for key, limits in errors.items()
+        ))
+        self.errors = errors
+
+
+class PomodoroTimer:
+    def __init__(self, history=None, storage=None, save_interval=SAVE_INTERVAL,
+                 clock=time.monotonic, wall_clock=time.time, journal=None):
+        # Основные настройки таймера по умолчанию
+        self.work_time = 25 * 60  # 25 минут в секундах
+        self.break_time = 5 * 60  # 5 минут в секундах
+        self.long_break_time = 15 * 60  # 15 минут длинного перерыва
+        self.sessions_before_long_break = 4
+        
+        # Часы таймера: монотонное время, не зависящее от перевода системных часов,
+        # и системное время для отметок в журнале (подменяются в симуляции)
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self._deadline = None  # момент окончания сессии, пока таймер запущен
+        self._remaining = float(self.work_time)  # остаток сессии, пока таймер на паузе
+        self.wakeup = None  # вызывается при старте/паузе, чтобы планировщик пересчитал тик
+        self.events = EventBus()  # изменения состояния для интерфейса, хранилища и метрик
+        self.session_started_at = None  # время первого запуска текущей сессии
+        self.activity = None  # сэмплер активности (ActivitySampler), подключается интерфейсом
+        # Исполнитель блокирующих записей (журнал сессии) с одним потоком, чтобы записи
+        # шли по порядку; None — запись сразу в вызывающем потоке
+        self.io = None
+        
+        # Текущее состояние
+        self.is_work_time = True
+        self.session_count = 0
+        self.total_pomodoros = 0
+        
+        # Статистика: журнал сессий и агрегаты за текущие день/неделю/месяц
+        self.history = history if history is not None else SessionLog(HISTORY_FILE)
+        self.daily_stats = {"work": 0, "break": 0, "pomodoros": 0}
+        self.weekly_stats = {"work": 0, "break": 0, "pomodoros": 0}
+        self.monthly_stats = {"work": 0, "break": 0, "pomodoros": 0}
+        # Время по тегам за те же периоды: {имя тега: {"work": ..., "pomodoros": ...}}
+        self.daily_tag_stats = {}
+        self.weekly_tag_stats = {}
+        self.monthly_tag_stats = {}
+        self.stats_until = 0.0  # начало следующего дня: после него агрегаты перечитываются
+        
+        # Пользовательские данные
+        self.tags = TagRegistry([
+            {"id": 1, "name": "Работа", "color": "red"},
+            {"id": 2, "name": "Учеба", "color": "blue"},
+            {"id": 3, "name": "Личное", "color": "green"}
+        ])
+        self.current_tag = "Работа"
+        self.ledger = PointsLedger(on_entry=self._on_ledger_entry)  # очки и история покупок
+        self.shop_items = [
+            ShopItem(1, "1 час игры", 100, "1 час игры на ПК"),
+            ShopItem(2, "Кофе-брейк", 50, "15 минут перерыва с кофе"),
+            ShopItem(3, "Вечер кино", 200, "Вечер просмотра фильма")
+        ]
+        self._index_shop_items()
+        
+        # Настройки темы
+        self.themes = {
+            "light": {
+                "primary": "blue",
+                "background": "white",
+                "surface": "grey100",
+                "on_primary": "white",
+                "on_background": "black",
+                "on_surface": "black"
+            },
+            "dark": {
+                "primary": "blue700",
+                "background": "black",
+                "surface": "grey900",
+                "on_primary": "white",
+                "on_background": "white",
+                "on_surface": "white"
+            },
+            "purple": {
+                "primary": "purple",
+                "background": "purple50",
+                "surface": "purple100",
+                "on_primary": "white",
+                "on_background": "black",
+                "on_surface": "black"
+            },
+            "blue": {
+                "primary": "blue",
+                "background": "blue50",
+                "surface": "blue100",
+                "on_primary": "white",
+                "on_background": "black",
+                "on_surface": "black"
+            },
+            "green": {
+                "primary": "green",
+                "background": "green50",
+                "surface": "green100",
+                "on_primary": "white",
+                "on_background": "black",
+                "on_surface": "black"
+            }
+        }
+        self.current_theme = "light"
+        
+        # Фоновое сохранение: правки копятся и пишутся в хранилище одной записью
+        self.storage = storage if storage is not None else JsonFileStorage()
+        self._changes = {}  # изменения с момента последней записи
+        self._changes_lock = threading.Lock()
+        self.persistence = PersistenceWorker(
+            self._take_changes,
+            self._write_changes,
+            interval=save_interval,
+        )
+        self.events.subscribe(
+            SETTINGS_CHANGED, lambda event: self._record_change("settings", event.data["settings"])
+        )
+        
+        # Загрузка данных
+        self.load_data()
+        self.current_time = self.work_time
+        self.refresh_stats()
+
+        # Журнал переходов сессии: после перезапуска или сбоя сессия продолжается
+        # с остатком, посчитанным по системным часам
+        self.journal = journal
+        if self.journal is not None:
+            state = self.journal.load()
+            if state is not None:
+                self.restore_running_state(state)
+            self.events.subscribe(
+                (SESSION_STARTED, SESSION_PAUSED, SESSION_RESET, SESSION_COMPLETED),
+                lambda event: self.run_io(self.journal.append, self.running_state()),
+            )
+
+    def run_io(self, fn, *args):
+        """Блокирующая запись: в исполнителе io, если он задан, иначе сразу"""
+        if self.io is None:
+            return fn(*args)
+        return self.io.submit(fn, *args)
+
+    def format_time(self, seconds):
+        """Форматирование времени в MM:SS"""
+        minutes = seconds // 60
+        seconds = seconds % 60
+        return f"{minutes:02d}:{seconds:02d}"
+
+    @property
+    def is_running(self):
+        """Запущен ли таймер"""
+        return self._deadline is not None
+
+    @property
+    def current_time(self):
+        """Оставшееся время сессии в целых секундах (с округлением вверх)"""
+        return max(0, math.ceil(self.remaining_time()))
+
+    @current_time.setter
+    def current_time(self, seconds):
+        if self._deadline is not None:
+            self._deadline = self.clock() + seconds
+        self._remaining = float(seconds)
+
+    def remaining_time(self):
+        """Точный остаток сессии в секундах"""
+        if self._deadline is not None:
+            return self._deadline - self.clock()
+        return self._remaining
+
+    def seconds_to_next_wakeup(self):
+        """Время до ближайшего тика или до устаревания агрегатов (и на паузе)"""
+        until_stats = max(0.0, self.stats_until - self.wall_clock())
+        tick = self.seconds_to_next_tick()
+        return until_stats if tick is None else min(tick, until_stats)
+
+    def seconds_to_next_tick(self):
+        """Время до следующей смены отображаемой секунды; None, если таймер на паузе"""
+        if self._deadline is None:
+            return None
+        remaining = self.remaining_time()
+        if remaining <= 0:
+            return 0.0
+        fraction = remaining % 1.0
+        # Небольшой запас, чтобы проснуться уже после границы секунды
+        return (fraction if fraction > 0 else 1.0) + 0.005
+
+    def running_state(self):
+        """Состояние текущей сессии; дедлайн хранится по системным часам, чтобы пережить перезапуск"""
+        remaining = self.remaining_time()
+        return {
+            "is_work_time": self.is_work_time,
+            "session_count": self.session_count,
+            "total_pomodoros": self.total_pomodoros,
+            "current_tag": self.current_tag,
+            "remaining": remaining,
+            "deadline": self.wall_clock() + remaining if self.is_running else None,
+            "session_started_at": self.session_started_at,
+        }
+
+    def restore_running_state(self, state):
+        """Восстановление сессии; у запущенного таймера остаток считается от сохранённого дедлайна"""
+        self.is_work_time = state.get("is_work_time", self.is_work_time)
+        self.session_count = state.get("session_count", self.session_count)
+        self.total_pomodoros = state.get("total_pomodoros", self.total_pomodoros)
+        self.current_tag = state.get("current_tag", self.current_tag)
+        self.session_started_at = state.get("session_started_at")
+        deadline = state.get("deadline")
+        if deadline is not None:
+            self._deadline = self.clock() + (deadline - self.wall_clock())
+            self._notify_wakeup()
+        else:
+            self._deadline = None
+            self._remaining = float(state.get("remaining", self._remaining))
+
+    def _notify_wakeup(self):
+        if self.wakeup is not None:
+            self.wakeup()
+
+    def start_timer(self):
+        """Запуск таймера"""
+        if self._deadline is None:
+            self._deadline = self.clock() + self._remaining
+            resumed = self.session_started_at is not None
+            if not resumed:
+                self.session_started_at = self.wall_clock()
+            self._notify_wakeup()
+            self.events.publish(SESSION_STARTED, is_work_time=self.is_work_time, resumed=resumed)
+
+    def pause_timer(self):
+        """Пауза таймера"""
+        if self._deadline is not None:
+            self._remaining = max(0.0, self._deadline - self.clock())
+            self._deadline = None
+            self._notify_wakeup()
+            self.events.publish(SESSION_PAUSED, remaining=self._remaining)
+
+    def reset_timer(self):
+        """Сброс таймера"""
+        self.pause_timer()
+        self.session_started_at = None
+        if self.is_work_time:
+            self.current_time = self.work_time
+        else:
+            self.current_time = self.break_length()
+        self.events.publish(SESSION_RESET, is_work_time=self.is_work_time)
+
+    def toggle_timer(self):
+        """Переключение состояния таймера"""
+        if self.is_running:
+            self.pause_timer()
+        else:
+            self.start_timer()
+
+    def update_timer(self):
+        """Обновление таймера: остаток считается от дедлайна, а не уменьшается на тик"""
+        if self.stats_expired():
+            self.publish_stats(self.read_stats())
+        if not self.is_running:
+            return
+        if self.remaining_time() <= 0:
+            self.complete_session()
+        else:
+            self.events.publish(TICK, remaining=self.current_time)
+
+    def is_long_break(self):
+        """Положен ли (или идёт ли) длинный перерыв после последней рабочей сессии"""
+        return is_long_break(self.session_count, self.sessions_before_long_break)
+
+    def break_length(self):
+        """Длительность текущего перерыва"""
+        return self.long_break_time if self.is_long_break() else self.break_time
+
+    def read_stats(self, timestamp=None):
+        """Агрегаты за день, неделю и месяц момента timestamp из журнала (чтение базы)"""
+        timestamp = self.wall_clock() if timestamp is None else timestamp
+        return self.history.current_stats(timestamp), self.history.current_tag_stats(timestamp), next_day(timestamp)
+
+    def apply_stats(self, stats):
+        """Установка агрегатов, прочитанных read_stats()"""
+        (self.daily_stats, self.weekly_stats, self.monthly_stats), (
+            self.daily_tag_stats, self.weekly_tag_stats, self.monthly_tag_stats
+        ), self.stats_until = stats
+
+    def stats_expired(self):
+        """Наступил ли новый день: неделя и месяц тоже сменяются только в полночь"""
+        return self.wall_clock() >= self.stats_until
+
+    def publish_stats(self, stats):
+        """Установка агрегатов нового дня и событие для интерфейса"""
+        self.apply_stats(stats)
+        self.events.publish(STATS_CHANGED)
+
+    def refresh_stats(self, timestamp=None):
+        """Чтение агрегатов за текущие день, неделю и месяц из журнала"""
+        self.apply_stats(self.read_stats(timestamp))
+
+    def session_tag(self):
+        """Имя тега текущей сессии в том написании, в каком он заведён"""
+        tag = self.tags.find(self.current_tag)
+        return tag.name if tag is not None else self.current_tag
+
+    def complete_session(self):
+        """Завершение сессии"""
+        completion = self.end_session()
+        self.store_session(completion)
+        self.publish_session(completion)
+
+    def end_session(self):
+        """Переход к следующей сессии без записи в журнал; возвращает данные завершённой сессии.
+
+        Завершение разбито на три шага, чтобы в асинхронном режиме состояние
+        менялось в цикле событий, а store_session() выполнялся в пуле потоков.
+        """
+        # Момент окончания считается по дедлайну, а не по времени обработки тика
+        ended_at = self.wall_clock() + min(0.0, self.remaining_time())
+        started_at = self.session_started_at if self.session_started_at is not None else ended_at
+        self.session_started_at = None
+        # Таймер останавливается до выставления новой длительности,
+        # чтобы задержка интерфейса не съедала время следующей сессии
+        self._deadline = None
+        tag = self.session_tag()
+        entry = None
+        distraction = None
+        kind, duration, points, session_count = session_outcome(
+            self.is_work_time, self.session_count, self.work_time, self.break_time, self.long_break_time,
+            self.sessions_before_long_break,
+        )
+        if self.is_work_time:
+            # Завершение рабочей сессии
+            if self.activity is not None:
+                distraction = self.activity.finish()
+            self.total_pomodoros += 1
+            self.session_count = session_count
+            entry = self.ledger.earn(points, POMODORO_REASON, ended_at)  # Начисление очков за завершенный помодоро
+            
+            # Определение типа перерыва
+            self.current_time = self.break_length()
+            self.is_work_time = False
+        else:
+            # Завершение перерыва
+            self.current_time = self.work_time
+            self.is_work_time = True
+        return {
+            "kind": kind, "tag": tag, "started_at": started_at, "ended_at": ended_at, "duration": duration,
+            "distraction": distraction, "entry": entry,
+        }
+
+    def store_session(self, completion):
+        """Запись завершённой сессии в журнал и чтение новых агрегатов (блокирующий шаг)"""
+        self.history.record(
+            completion["kind"], completion["tag"], completion["started_at"], completion["ended_at"],
+            completion["duration"], completion["distraction"],
+        )
+        completion["stats"] = self.read_stats(completion["ended_at"])
+
+    def publish_session(self, completion):
+        """Установка агрегатов и рассылка событий завершения"""
+        self.apply_stats(completion["stats"])
+        # События рассылаются, когда состояние и статистика уже обновлены
+        self.events.publish(
+            SESSION_COMPLETED, kind=completion["kind"], tag=completion["tag"], started_at=completion["started_at"],
+            ended_at=completion["ended_at"], duration=completion["duration"], distraction=completion["distraction"],
+        )
+        if completion["entry"] is not None:
+            self.events.publish(POINTS_CHANGED, balance=self.points, entry=completion["entry"])
+        if not self.is_work_time:
+            self.events.publish(BREAK_STARTED, long=self.is_long_break(), duration=self.break_length())
+
+    def add_tag(self, name, color):
+        """Добавление нового тега; None, если тег с таким именем уже есть"""
+        tag = self.tags.add(name, color)
+        if tag is not None:
+            self._record_change("tags", tag.to_dict())
+        return tag
+
+    def _index_shop_items(self):
+        """Выдача постоянных id товарам без них и построение индекса по id"""
+        self._next_shop_id = max((item.id or 0 for item in self.shop_items), default=0) + 1
+        for item in self.shop_items:
+            if not item.id:
+                item.id = self._next_shop_id
+                self._next_shop_id += 1
+        self._shop_by_id = {item.id: item for item in self.shop_items}
+
+    def shop_item(self, item_id):
+        """Товар по постоянному id (или None)"""
+        return self._shop_by_id.get(item_id)
+
+    def add_shop_item(self, name, cost, description):
+        """Добавление нового товара в магазин"""
+        item = ShopItem(self._next_shop_id, name, cost, description)
+        self._next_shop_id += 1
+        self.shop_items.append(item)
+        self._shop_by_id[item.id] = item
+        self._record_change("shop_items", item.to_dict())
+        return item
+
+    def remove_shop_item(self, item_id):
+        """Удаление товара из магазина"""
+        item = self._shop_by_id.pop(item_id, None)
+        if item is None:
+            return False
+        self.shop_items.remove(item)
+        self._record_change("shop_items_removed", item_id)
+        return True
+
+    @property
+    def points(self):
+        """Баланс очков"""
+        return self.ledger.balance
+
+    def buy_item(self, item_id):
+        """Покупка товара по id: проверка баланса и списание выполняются атомарно"""
+        item = self._shop_by_id.get(item_id)
+        if item is None:
+            return False
+        entry = self.ledger.spend(item.cost, item.name, self.wall_clock())
+        if entry is None:
+            return False
+        self.events.publish(POINTS_CHANGED, balance=self.points, entry=entry)
+        return True
+
+    def _on_ledger_entry(self, entry):
+        # Вызывается после снятия блокировки журнала; POINTS_CHANGED публикуют вызывающие.
+        # Баланс читается под блокировкой изменений, чтобы последним записался самый свежий
+        with self._changes_lock:
+            self._changes.setdefault("ledger", []).append(entry)
+            self._changes["points"] = self.ledger.balance
+        self.persistence.mark_dirty()
+
+    def set_theme(self, theme_name):
+        """Установка темы"""
+        self.update_settings(theme=theme_name)
+
+    def settings_errors(self, **values):
+        """Ошибки настроек: ключ -> допустимый диапазон (или None для прочих ошибок)"""
+        errors = {}
+        for key, value in values.items():
+            if key == "theme":
+                if value not in self.themes:
+                    errors[key] = None
+            elif key in SETTINGS_LIMITS:
+                low, high = SETTINGS_LIMITS[key]
+                if not isinstance(value, int) or isinstance(value, bool) or not low <= value <= high:
+                    errors[key] = (low, high)
+            else:
+                errors[key] = None
+        return errors
+
+    def update_settings(self, **values):
+        """Проверка и применение настроек одним изменением.
+
+        При любой ошибке ничего не меняется и выбрасывается SettingsError.
+        Возвращает изменившиеся настройки; если их нет, событие не публикуется.
+        """
+        errors = self.settings_errors(**values)
+        if errors:
+            raise SettingsError(errors)
+        changed = {}
+        for key, value in values.items():
+            attr = "current_theme" if key == "theme" else key
+            if getattr(self, attr) != value:
+                setattr(self, attr, value)
+                changed[key] = value
+        if not changed:
+            return changed
+        # Длительность ещё не начатой сессии следует за настройками
+        if not self.is_running and self.session_started_at is None:
+            self.current_time = self.work_time if self.is_work_time else self.break_length()
+        self.events.publish(SETTINGS_CHANGED, settings=self.current_settings(), changed=changed)
+        return changed
+
+    def current_settings(self):
+        """Настройки в формате хранилища (без копирования журнала очков)"""
+        return {
+            "theme": self.current_theme,
+            "work_time": self.work_time,
+            "break_time": self.break_time,
+            "long_break_time": self.long_break_time,
+            "sessions_before_long_break": self.sessions_before_long_break
+        }
+
+    def to_dict(self):
+        """Снимок сохраняемых данных"""
+        return {
+            "tags": [tag.to_dict() for tag in self.tags],
+            "shop_items": [item.to_dict() for item in self.shop_items],
+            "points": self.points,
+            "ledger": self.ledger.entries(),
+            **self.current_settings()
+        }
+
+    def _record_change(self, section, value):
+        """Запоминание изменения для хранилища: добавленные записи копятся, остальное заменяется"""
+        with self._changes_lock:
+            if section in APPENDED_SECTIONS:
+                self._changes.setdefault(section, []).append(dict(value) if isinstance(value, dict) else value)
+            else:
+                self._changes[section] = value
+        self.persistence.mark_dirty()
+
+    def _take_changes(self):
+        """Накопленные изменения для фоновой записи"""
+        with self._changes_lock:
+            changes, self._changes = self._changes, {}
+        return changes
+
+    def _write_changes(self, changes):
+        # Полный снимок строится, только если он нужен хранилищу, и вне блокировки изменений
+        try:
+            self.storage.write(self.to_dict, changes)
+        except Exception:
+            # Неудачная запись не должна терять изменения: они вернутся в очередь
+            with self._changes_lock:
+                for section, value in changes.items():
+                    if section in APPENDED_SECTIONS:
+                        self._changes[section] = value + self._changes.get(section, [])
+                    else:
+                        self._changes.setdefault(section, value)
+            raise
+
+    def save_data(self):
+        """Сохранение данных (в фоне, несколько правок подряд дают одну запись)"""
+        # Баланс попадает в изменения вместе с каждой записью журнала очков
+        self._record_change("settings", self.current_settings())
+        self.persistence.mark_dirty()
+
+    def flush_data(self):
+        """Немедленная запись несохранённых изменений"""
+        self.save_data()
+        self.persistence.flush()
+
+    def close(self):
+        """Завершение работы: запись последних изменений и закрытие хранилищ"""
+        self.save_data()
+        self.persistence.close()
+        if self.journal is not None:
+            self.journal.snapshot(self.running_state())
+            self.journal.close()
+        self.storage.close()
+        self.history.close()
+
+    def load_data(self):
+        """Загрузка данных из хранилища"""
+        data = self.storage.load()
+        if not isinstance(data, dict):
+            return
+        self.tags = TagRegistry(data.get("tags", self.tags))
+        if "shop_items" in data:
+            self.shop_items = [ShopItem.from_dict(item) for item in data["shop_items"]]
+        self._index_shop_items()
+        self.ledger = PointsLedger(data.get("ledger", ()), on_entry=self._on_ledger_entry)
+        # Баланс из старых данных без истории переносится одной корректировкой
+        untracked = data.get("points", 0) - self.ledger.balance
+        if untracked:
+            self.ledger.adjust(untracked, "Начальный баланс", self.wall_clock())
+        self.current_theme = data.get("theme", "light")
+        self.work_time = data.get("work_time", 25 * 60)
+        self.break_time = data.get("break_time", 5 * 60)
+        self.long_break_time = data.get("long_break_time", 15 * 60)
+        self.sessions_before_long_break = data.get("sessions_before_long_break", 4)
+
+
+def create_timer(user_id=None):
+    """Таймер пользователя: без user_id — локальный JSON-файл, иначе общая база SQLite"""
+    if user_id is None:
+        history = SessionLog(HISTORY_FILE)
+        storage = JsonFileStorage()
+        journal = StateJournal()
+    else:
+        pool = shared_pool()
+        history = SessionLog(user_id=user_id, pool=pool)
+        storage = SqliteStorage(user_id, pool)
+        journal = SqliteStateJournal(user_id, pool)
+    timer = PomodoroTimer(history=history, storage=instrument_storage(storage), journal=journal)
+    return instrument_timer(timer)
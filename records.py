@@ -0,0 +1,138 @@
+from array import array
+
+
+class Record:
+    """Основа компактных записей: поля в __slots__, без словаря у каждого экземпляра.
+
+    to_dict()/from_dict() переводят запись в формат pomodoro_data.json и обратно
+    без потерь, поэтому хранилища и старые файлы работают со словарями как раньше.
+    """
+
+    __slots__ = ()
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class Tag(Record):
+    __slots__ = ("id", "name", "color")
+
+    def __init__(self, id, name, color):
+        self.id = id
+        self.name = name
+        self.color = color
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("id"), data["name"], data.get("color"))
+
+
+class ShopItem(Record):
+    __slots__ = ("id", "name", "cost", "description")
+
+    def __init__(self, id, name, cost, description=""):
+        self.id = id
+        self.name = name
+        self.cost = cost
+        self.description = description
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get("id"), data["name"], data["cost"], data.get("description", ""))
+
+
+class Session(Record):
+    """Одна сессия журнала (строка SessionColumns)"""
+
+    __slots__ = ("kind", "tag", "started_at", "ended_at", "duration")
+
+    def __init__(self, kind, tag, started_at, ended_at, duration):
+        self.kind = kind
+        self.tag = tag
+        self.started_at = started_at
+        self.ended_at = ended_at
+        self.duration = duration
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["kind"], data.get("tag"), data["started_at"], data["ended_at"], data["duration"])
+
+
+class SessionColumns:
+    """Журнал сессий в памяти по столбцам.
+
+    Время и длительности лежат в типизированных массивах array, а вид сессии
+    и тег — номерами в массивах байтов/целых со справочниками строк, поэтому
+    сессия занимает около 30 байт вместо словаря с пятью объектами.
+    Строки отдаются записями Session, to_dicts()/from_dicts() дают тот же
+    формат, что и Session.to_dict().
+    """
+
+    def __init__(self):
+        self.started_at = array("d")
+        self.ended_at = array("d")
+        self.duration = array("l")
+        self.kind_id = array("B")
+        self.tag_id = array("i")  # -1 — сессия без тега
+        self.kinds = []  # номер -> вид сессии
+        self.tags = []  # номер -> имя тега
+        self._kind_ids = {}
+        self._tag_ids = {}
+
+    def _intern(self, value, values, ids):
+        index = ids.get(value)
+        if index is None:
+            index = ids[value] = len(values)
+            values.append(value)
+        return index
+
+    def append(self, kind, tag, started_at, ended_at, duration):
+        self.started_at.append(started_at)
+        self.ended_at.append(ended_at)
+        self.duration.append(duration)
+        self.kind_id.append(self._intern(kind, self.kinds, self._kind_ids))
+        self.tag_id.append(-1 if tag is None else self._intern(tag, self.tags, self._tag_ids))
+
+    def kind_code(self, kind):
+        """Номер вида сессии в kind_id (или None, если таких сессий нет)"""
+        return self._kind_ids.get(kind)
+
+    def tag_code(self, tag):
+        """Номер тега в tag_id (или None, если таких сессий нет)"""
+        return self._tag_ids.get(tag)
+
+    def __len__(self):
+        return len(self.ended_at)
+
+    def __getitem__(self, index):
+        tag_id = self.tag_id[index]
+        return Session(
+            self.kinds[self.kind_id[index]],
+            None if tag_id < 0 else self.tags[tag_id],
+            self.started_at[index],
+            self.ended_at[index],
+            self.duration[index],
+        )
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def to_dicts(self):
+        return [session.to_dict() for session in self]
+
+    @classmethod
+    def from_dicts(cls, rows):
+        columns = cls()
+        for row in rows:
+            columns.append(row["kind"], row.get("tag"), row["started_at"], row["ended_at"], row["duration"])
+        return columns
@@ -0,0 +1,395 @@
+import bisect
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from exchange import WRITERS, session_records
+from history import SessionLog, empty_stats
+from ledger import ADJUST, EARN, SPEND
+from pomodoro import POINTS_PER_POMODORO, POMODORO_REASON
+
+REPORT_CACHE_SIZE = 32  # готовых отчётов в кэше
+REPORT_TITLES = {
+    "summary": "Итоги по месяцам",
+    "tags": "Время по тегам",
+    "ledger": "Сверка очков",
+    "export": "Выгрузка истории",
+}
+
+_logs = {}  # (путь, пользователь) -> SessionLog, открытый в процессе пула
+
+
+def _history(source):
+    """Журнал для порции: сам SessionLog (пул потоков) или (путь, пользователь) в процессе"""
+    if isinstance(source, SessionLog):
+        return source
+    log = _logs.get(source)
+    if log is None:
+        log = _logs[source] = SessionLog(*source)
+    return log
+
+
+def _timestamp(day):
+    """Начало дня по местному времени"""
+    return datetime.combine(day, datetime.min.time()).timestamp()
+
+
+def months(first, last):
+    """Диапазон дат first..last по месяцам: [(первый день, день после последнего), ...]"""
+    chunks = []
+    start = first
+    while start <= last:
+        next_month = (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+        end = min(next_month, last + timedelta(days=1))
+        chunks.append((start, end))
+        start = end
+    return chunks
+
+
+# Порции отчётов: функции верхнего уровня, чтобы их можно было передать в процесс
+
+def month_summary(history, start, end):
+    """Итоги месяца: время работы и отдыха, помодоро, дни с работой и лучший день"""
+    days = _history(history).daily_totals(_timestamp(start), _timestamp(end))
+    best = max(days, key=lambda row: row[1], default=None)
+    return {
+        "month": start.strftime("%Y-%m"),
+        "work": sum(row[1] for row in days),
+        "break": sum(row[2] for row in days),
+        "pomodoros": sum(row[3] for row in days),
+        "active_days": sum(1 for row in days if row[1]),
+        "best_day": best[0] if best is not None and best[1] else None,
+    }
+
+
+def month_tags(history, start, end):
+    """Рабочее время месяца по тегам: (месяц, {тег: {"work", "pomodoros"}})"""
+    rows = _history(history).tag_totals(_timestamp(start), _timestamp(end))
+    return start.strftime("%Y-%m"), {tag: {"work": work, "pomodoros": count} for tag, work, count in rows}
+
+
+def month_ledger(history, start, end, entries):
+    """Сверка месяца: записи очков против рабочих сессий журнала"""
+    days = _history(history).daily_totals(_timestamp(start), _timestamp(end))
+    totals = {EARN: 0, SPEND: 0, ADJUST: 0}
+    rewarded = change = low = 0
+    for entry in entries:
+        totals[entry["kind"]] += entry["amount"]
+        if entry["kind"] == EARN and entry["reason"] == POMODORO_REASON:
+            rewarded += entry["amount"]
+        change += -entry["amount"] if entry["kind"] == SPEND else entry["amount"]
+        low = min(low, change)
+    pomodoros = sum(row[3] for row in days)
+    return {
+        "month": start.strftime("%Y-%m"),
+        "pomodoros": pomodoros,
+        "expected": pomodoros * POINTS_PER_POMODORO,
+        "rewarded": rewarded,
+        "earned": totals[EARN],
+        "spent": totals[SPEND],
+        "adjusted": totals[ADJUST],
+        "change": change,
+        "low": low,  # наименьшее изменение баланса с начала месяца
+    }
+
+
+def export_log(history, entries, path, fmt):
+    """Выгрузка всего журнала и записей очков в файл (через временный файл)"""
+    count = 0
+
+    def records():
+        nonlocal count
+        for record in session_records(_history(history)):
+            count += 1
+            yield record
+        for entry in entries:
+            count += 1
+            yield dict(entry, type="ledger")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+        WRITERS[fmt](records(), f)
+    os.replace(tmp_path, path)
+    return {"path": path, "records": count}
+
+
+# Планы отчётов: порции (функция, аргументы) и сборка итога из их результатов.
+# План строится в вызывающем потоке и должен быть дешёвым
+
+def combine_summary(parts):
+    total = dict(empty_stats(), active_days=0)
+    for part in parts:
+        for key in total:
+            total[key] += part[key]
+    return {"months": parts, "total": total}
+
+
+def plan_summary(timer, history, first, last):
+    return [(month_summary, (history, start, end)) for start, end in months(first, last)], combine_summary
+
+
+def combine_tags(parts):
+    tags = {}
+    for month, totals in parts:
+        for tag, stats in totals.items():
+            row = tags.setdefault(tag, {"work": 0, "pomodoros": 0, "months": {}})
+            row["work"] += stats["work"]
+            row["pomodoros"] += stats["pomodoros"]
+            row["months"][month] = stats["work"]
+    total = sum(row["work"] for row in tags.values())
+    for row in tags.values():
+        row["share"] = row["work"] / total if total else 0.0
+    return dict(sorted(tags.items(), key=lambda item: -item[1]["work"]))
+
+
+def plan_tags(timer, history, first, last):
+    return [(month_tags, (history, start, end)) for start, end in months(first, last)], combine_tags
+
+
+def plan_ledger(timer, history, first, last):
+    entries = sorted(timer.ledger.entries(), key=lambda entry: entry["time"])
+    balance = timer.points
+    times = [entry["time"] for entry in entries]
+    chunks = months(first, last)
+    lo = bisect.bisect_left(times, _timestamp(first))
+    hi = bisect.bisect_left(times, _timestamp(chunks[-1][1])) if chunks else lo
+    signed = [-entry["amount"] if entry["kind"] == SPEND else entry["amount"] for entry in entries]
+    opening = sum(signed[:lo])
+    later = sum(signed[hi:])
+
+    tasks = []
+    for start, end in chunks:
+        mid = bisect.bisect_left(times, _timestamp(end))
+        tasks.append((month_ledger, (history, start, end, entries[lo:mid])))
+        lo = mid
+
+    def combine(parts):
+        running = opening
+        low = opening
+        for part in parts:
+            low = min(low, running + part["low"])
+            running += part["change"]
+        return {
+            "months": parts,
+            "opening": opening,
+            "closing": running,
+            "lowest": low,
+            "balance": balance,
+            # Баланс, пересчитанный по записям, должен совпасть с хранимым
+            "balanced": running + later == balance,
+            "mismatched": [part["month"] for part in parts if part["expected"] != part["rewarded"]],
+        }
+
+    return tasks, combine
+
+
+def plan_export(timer, history, first, last, path, fmt="jsonl"):
+    return [(export_log, (history, timer.ledger.entries(), path, fmt))], lambda parts: parts[0]
+
+
+REPORTS = {"summary": plan_summary, "tags": plan_tags, "ledger": plan_ledger, "export": plan_export}
+UNCACHED = {"export"}  # отчёты с побочным действием: выполняются при каждом запросе
+
+
+class ReportJob:
+    """Построение одного отчёта: порции в пуле, прогресс, отмена и итог в future"""
+
+    def __init__(self, key, tasks, combine):
+        self.key = key
+        self.total = len(tasks)
+        self.completed = 0
+        self.future = Future()
+        self._tasks = tasks
+        self._combine = combine
+        self._parts = [None] * self.total
+        self._futures = []
+        self._progress = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def finished(cls, key, result):
+        """Задание с готовым итогом (из кэша)"""
+        job = cls(key, [], None)
+        job.future.set_result(result)
+        return job
+
+    def start(self, executor):
+        if not self._tasks:
+            self._finish(self.future.set_result, self._combine([]))
+            return
+        for index, (fn, args) in enumerate(self._tasks):
+            future = executor.submit(fn, *args)
+            future.add_done_callback(lambda future, index=index: self._on_part(index, future))
+            self._futures.append(future)
+
+    def _finish(self, setter, value):
+        try:
+            setter(value)
+        except InvalidStateError:
+            pass  # задание отменено, пока досчитывалась последняя порция
+
+    def _on_part(self, index, future):
+        if future.cancelled() or self.future.done():
+            return
+        error = future.exception()
+        if error is not None:
+            self.cancel_parts()
+            self._finish(self.future.set_exception, error)
+            return
+        with self._lock:
+            self._parts[index] = future.result()
+            self.completed += 1
+            completed = self.completed
+            callbacks = list(self._progress)
+        for callback in callbacks:
+            callback(completed, self.total)
+        if completed == self.total:
+            try:
+                result = self._combine(self._parts)
+            except Exception as error:
+                self._finish(self.future.set_exception, error)
+            else:
+                self._finish(self.future.set_result, result)
+
+    def on_progress(self, callback):
+        """callback(готово порций, всего) после каждой порции"""
+        with self._lock:
+            self._progress.append(callback)
+
+    def add_done_callback(self, fn):
+        """fn(job) по готовности, ошибке или отмене (сразу, если задание уже завершено)"""
+        self.future.add_done_callback(lambda future: fn(self))
+
+    def cancel_parts(self):
+        for future in self._futures:
+            future.cancel()
+
+    def cancel(self):
+        """Отмена: ожидающие порции снимаются, выполняющиеся досчитываются впустую"""
+        self.cancel_parts()
+        return self.future.cancel()
+
+    def cancelled(self):
+        return self.future.cancelled()
+
+    def done(self):
+        return self.future.done()
+
+    def result(self, timeout=None):
+        return self.future.result(timeout)
+
+
+class ReportPool:
+    """Построение отчётов вне обработчиков событий и тиков таймера.
+
+    Отчёт делится на порции по месяцам диапазона, порции выполняются в пуле
+    процессов (журнал каждый процесс открывает сам по пути к базе) или, для
+    журнала в памяти и при processes=False, в пуле потоков. Итоги кэшируются
+    по отчёту, пользователю, диапазону и версии данных — последним id журнала
+    сессий и журнала очков, которые только дополняются, поэтому новая сессия
+    или покупка делает старые итоги недоступными без явного сброса. Одинаковый
+    запрос, пока отчёт строится, получает то же задание.
+    """
+
+    def __init__(self, processes=True, max_workers=None, cache_size=REPORT_CACHE_SIZE):
+        self.processes = processes
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._executors = {}  # "process" / "thread" -> пул, создаётся при первом отчёте
+        self._cache = OrderedDict()  # ключ -> итог, последние cache_size
+        self._jobs = {}  # ключ -> строящееся задание
+
+    def _source(self, history):
+        """Журнал для порций и вид пула, в котором они выполняются"""
+        if self.processes and history.path != ":memory:":
+            return (os.path.abspath(history.path), history.user_id), "process"
+        return history, "thread"
+
+    def _executor(self, kind):
+        executor = self._executors.get(kind)
+        if executor is None:
+            if kind == "process":
+                # spawn: процесс не наследует потоки и открытые соединения SQLite
+                executor = ProcessPoolExecutor(self.max_workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="report")
+            self._executors[kind] = executor
+        return executor
+
+    def submit(self, report, timer, first, last, on_progress=None, **options):
+        """Отчёт report по данным timer за даты first..last; возвращает ReportJob"""
+        history, kind = self._source(timer.history)
+        if kind == "process":
+            user = history
+        elif history.path == ":memory:":
+            user = ("memory", id(history))  # у каждого журнала в памяти свои данные
+        else:
+            user = (os.path.abspath(history.path), history.user_id)
+        version = (timer.history.last_id(), timer.ledger.last_id)
+        key = (report, user, first, last, version, tuple(sorted(options.items())))
+        start = False
+        with self._lock:
+            if report not in UNCACHED and key in self._cache:
+                self._cache.move_to_end(key)
+                job = ReportJob.finished(key, self._cache[key])
+            else:
+                job = self._jobs.get(key)
+                if job is None or job.cancelled():
+                    tasks, combine = REPORTS[report](timer, history, first, last, **options)
+                    job = self._jobs[key] = ReportJob(key, tasks, combine)
+                    start = True
+        if on_progress is not None:
+            job.on_progress(on_progress)
+        if start:
+            # Запуск вне блокировки: порции могут завершиться раньше, чем вернётся submit
+            job.add_done_callback(self._on_done)
+            job.start(self._executor(kind))
+        return job
+
+    def _on_done(self, job):
+        with self._lock:
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+            if job.key[0] in UNCACHED or job.cancelled() or job.future.exception() is not None:
+                return
+            self._cache[job.key] = job.result()
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def close(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            executors, self._executors = list(self._executors.values()), {}
+        for job in jobs:
+            job.cancel()
+        for executor in executors:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def report_range(history, today, months_back=None):
+    """Даты отчёта: последние months_back месяцев по today или вся история журнала"""
+    if months_back is None:
+        span = history.span()
+        first = date.fromtimestamp(span[0]) if span is not None else today
+    else:
+        first = today.replace(day=1)
+        for _ in range(months_back - 1):
+            first = (first - timedelta(days=1)).replace(day=1)
+    return first, today
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def default_report_pool():
+    """Пул отчётов, общий для всех сессий процесса"""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = ReportPool()
+        return _default_pool
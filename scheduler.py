@@ -0,0 +1,161 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ScheduledTimer:
+    """Регистрация таймера в планировщике"""
+
+    __slots__ = ("timer", "on_tick", "generation", "active")
+
+    def __init__(self, timer, on_tick):
+        self.timer = timer
+        self.on_tick = on_tick
+        self.generation = 0  # устаревшие записи кучи отбрасываются по поколению
+        self.active = True
+
+
+class TimerScheduler:
+    """Общий для процесса планировщик тиков.
+
+    Все запущенные таймеры лежат в одной куче по времени ближайшего тика и
+    обслуживаются одним потоком. Таймер на паузе лежит в куче одной записью
+    до полуночи, когда перечитываются его агрегаты, поэтому стоимость зависит
+    от числа запущенных таймеров, а не подключённых сессий.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def register(self, timer, on_tick):
+        """Подключение таймера; on_tick вызывается на каждой границе секунды и в полночь"""
+        handle = ScheduledTimer(timer, on_tick)
+        timer.wakeup = lambda: self.wake(handle)
+        self.wake(handle)
+        return handle
+
+    def unregister(self, handle):
+        """Отключение таймера (например, при отключении сессии)"""
+        with self._condition:
+            handle.active = False
+            handle.generation += 1
+            if handle.timer.wakeup is not None:
+                handle.timer.wakeup = None
+
+    def wake(self, handle):
+        """Пересчёт времени тика после старта, паузы или самого тика"""
+        delay = handle.timer.seconds_to_next_wakeup()
+        with self._condition:
+            if not handle.active:
+                return
+            handle.generation += 1
+            if delay is None:
+                return
+            due = self.clock() + delay
+            heapq.heappush(self._heap, (due, next(self._sequence), handle.generation, handle))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="timer-scheduler", daemon=True)
+                self._thread.start()
+            elif self._heap[0][3] is handle:
+                self._condition.notify()
+
+    def active_count(self):
+        """Количество таймеров, ожидающих тика или полуночи"""
+        with self._condition:
+            return sum(1 for entry in self._heap if entry[2] == entry[3].generation)
+
+    def _next_due(self):
+        """Ближайшие к исполнению регистрации; вызывается под условием"""
+        while True:
+            while self._heap and self._heap[0][2] != self._heap[0][3].generation:
+                heapq.heappop(self._heap)
+            if not self._heap:
+                self._condition.wait()
+                continue
+            delay = self._heap[0][0] - self.clock()
+            if delay > 0:
+                self._condition.wait(delay)
+                continue
+            due = []
+            now = self.clock()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, generation, handle = heapq.heappop(self._heap)
+                if generation == handle.generation:
+                    due.append(handle)
+            if due:
+                return due
+
+    def _run(self):
+        while True:
+            with self._condition:
+                due = self._next_due()
+            for handle in due:
+                try:
+                    handle.on_tick()
+                except Exception:
+                    logger.exception("Ошибка тика таймера, таймер отключён")
+                    self.unregister(handle)
+                    continue
+                self.wake(handle)
+
+
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+
+def default_scheduler():
+    """Планировщик, общий для всех сессий процесса"""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = TimerScheduler()
+        return _default_scheduler
+
+
+async def run_timer(timer, on_tick=None):
+    """Асинхронный цикл одного таймера для запуска задачей в цикле событий.
+
+    Просыпается на границах секунд, на паузе ждёт старта; в полночь перечитывает
+    агрегаты в исполнителе timer.io. При отмене задачи отключается от таймера.
+    Пробуждение по старту или паузе только пересчитывает время тика. Состояние таймера меняется в цикле событий, а запись завершённой
+    сессии в журнал выполняется в исполнителе timer.io. Изменения состояния
+    таймер сам рассылает событиями, on_tick нужен только для дополнительной
+    работы после каждого тика.
+    """
+    loop = asyncio.get_running_loop()
+    wakeup = asyncio.Event()
+    timer.wakeup = lambda: loop.call_soon_threadsafe(wakeup.set)
+    try:
+        while True:
+            delay = timer.seconds_to_next_wakeup()
+            try:
+                await asyncio.wait_for(wakeup.wait(), delay)
+                timed_out = False
+            except asyncio.TimeoutError:
+                timed_out = True
+            wakeup.clear()
+            if timer.stats_expired():
+                timer.publish_stats(await loop.run_in_executor(timer.io, timer.read_stats))
+            if not timer.is_running:
+                continue
+            if timer.remaining_time() <= 0:
+                completion = timer.end_session()
+                await loop.run_in_executor(timer.io, timer.store_session, completion)
+                timer.publish_session(completion)
+            elif timed_out:
+                timer.update_timer()
+            else:
+                continue
+            if on_tick is not None:
+                on_tick()
+    finally:
+        timer.wakeup = None
@@ -0,0 +1,74 @@
+GRAM = 3  # длина n-грамм индекса
+
+
+def _grams(text, size):
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+class ShopSearchIndex:
+    """Поиск товаров по подстроке в названии и описании.
+
+    Индекс хранит n-граммы длиной 1..GRAM каждого текста. Запрос сужает
+    кандидатов пересечением множеств для его n-грамм, а точное вхождение
+    проверяется только у оставшихся, поэтому поиск по тысячам товаров не
+    перебирает весь каталог. Добавление и удаление товара меняют только его записи.
+    """
+
+    def __init__(self, items=()):
+        self._texts = {}  # id товара -> текст для поиска
+        self._postings = {}  # n-грамма -> множество id
+        self._order = {}  # id -> порядковый номер, чтобы выдача шла в порядке каталога
+        self._counter = 0
+        for item in items:
+            self.add(item)
+
+    @staticmethod
+    def _text(item):
+        return f"{item.name}\n{item.description}".casefold()
+
+    def _item_grams(self, text):
+        grams = set()
+        for size in range(1, GRAM + 1):
+            grams |= _grams(text, size)
+        return grams
+
+    def add(self, item):
+        item_id = item.id
+        if item_id in self._texts:
+            self.remove(item_id)
+        text = self._text(item)
+        self._texts[item_id] = text
+        self._order[item_id] = self._counter
+        self._counter += 1
+        for gram in self._item_grams(text):
+            self._postings.setdefault(gram, set()).add(item_id)
+
+    def remove(self, item_id):
+        text = self._texts.pop(item_id, None)
+        if text is None:
+            return
+        del self._order[item_id]
+        for gram in self._item_grams(text):
+            ids = self._postings.get(gram)
+            if ids is not None:
+                ids.discard(item_id)
+                if not ids:
+                    del self._postings[gram]
+
+    def search(self, query):
+        """id товаров, содержащих query, в порядке добавления"""
+        query = query.strip().casefold()
+        if not query:
+            return sorted(self._texts, key=self._order.__getitem__)
+        grams = _grams(query, min(GRAM, len(query)))
+        candidates = None
+        for gram in sorted(grams, key=lambda g: len(self._postings.get(g, ()))):
+            ids = self._postings.get(gram)
+            if not ids:
+                return []
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return []
+        if len(query) > GRAM:
+            candidates = {item_id for item_id in candidates if query in self._texts[item_id]}
+        return sorted(candidates, key=self._order.__getitem__)
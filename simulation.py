@@ -0,0 +1,170 @@
+import sys
+import time
+from datetime import datetime, timedelta
+
+from history import PERIODS, SessionLog, empty_stats, period_keys
+from pomodoro import SETTINGS_LIMITS, PomodoroTimer, session_outcome
+from storage import MemoryStorage
+
+CHECK_CYCLES = 2_000  # циклов в сверке симуляции с настоящим таймером
+
+
+class VirtualClock:
+    """Виртуальные часы: время идёт только при вызове advance()"""
+
+    def __init__(self, start=0.0):
+        self.now = float(start)
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def simulated_timer(clock, settings=None):
+    """Таймер на виртуальных часах с журналом и хранилищем в памяти"""
+    return PomodoroTimer(
+        history=SessionLog(":memory:"),
+        storage=MemoryStorage(settings),
+        clock=clock.monotonic,
+        wall_clock=clock.time,
+    )
+
+
+def run_timer_sessions(timer, clock, sessions):
+    """Прогон sessions сессий настоящего PomodoroTimer без ожидания: часы сдвигаются до дедлайна"""
+    for _ in range(sessions):
+        timer.start_timer()
+        clock.advance(timer.remaining_time())
+        timer.update_timer()
+    return timer
+
+
+def simulate(cycles, work_time=25 * 60, break_time=5 * 60, long_break_time=15 * 60,
+             sessions_before_long_break=4, start_time=0.0):
+    """Пакетная симуляция cycles циклов «работа + перерыв» по правилам PomodoroTimer.
+
+    Работает без таймера, интерфейса и ожидания, поэтому годится для прогона
+    миллионов сессий. Правила смены сессий и очки берутся из session_outcome(),
+    как в complete_session(); статистика собирается по тем же ключам дня,
+    недели и месяца (по времени окончания сессии), что и в журнале.
+    Совпадение с настоящим таймером проверяет mismatches().
+    """
+    # Правила повторяются с периодом в sessions_before_long_break циклов
+    cycle = []
+    is_work_time, session_count = True, 0
+    for _ in range(2 * min(cycles, sessions_before_long_break)):
+        kind, duration, points, session_count = session_outcome(
+            is_work_time, session_count, work_time, break_time, long_break_time, sessions_before_long_break
+        )
+        cycle.append((kind, duration, points))
+        is_work_time = not is_work_time
+    repeats, rest = divmod(2 * cycles, len(cycle)) if cycle else (0, 0)
+
+    days = {}  # день -> [работа, отдых, помодоро, неделя, месяц]
+    ended = start_time
+    boundary = ended  # начало следующего дня: до него ключи периодов не меняются
+    current = None
+    points_total = 0
+    long_breaks = 0
+    for sessions in (cycle,) * repeats + (cycle[:rest],):
+        for kind, duration, points in sessions:
+            ended += duration
+            if ended >= boundary:
+                moment = datetime.fromtimestamp(ended)
+                boundary = datetime.combine(moment.date() + timedelta(days=1), datetime.min.time()).timestamp()
+                keys = period_keys(ended)
+                current = days.setdefault(keys["day"], [0, 0, 0, keys["week"], keys["month"]])
+            if kind == "work":
+                current[0] += duration
+                current[2] += 1
+                points_total += points
+            else:
+                current[1] += duration
+                if kind == "long_break":
+                    long_breaks += 1
+
+    rollups = {period: {} for period in PERIODS}
+    for day, (work, rest_time, pomodoros, week, month) in days.items():
+        for period, key in (("day", day), ("week", week), ("month", month)):
+            stats = rollups[period].setdefault(key, empty_stats())
+            stats["work"] += work
+            stats["break"] += rest_time
+            stats["pomodoros"] += pomodoros
+    work = sum(stats["work"] for stats in rollups["day"].values())
+    pomodoros = sum(stats["pomodoros"] for stats in rollups["day"].values())
+    end_keys = period_keys(ended)
+    return {
+        "sessions": 2 * cycles,
+        "pomodoros": pomodoros,
+        "long_breaks": long_breaks,
+        "work": work,
+        "break": ended - start_time - work,
+        "points": points_total,
+        "start_time": start_time,
+        "end_time": ended,
+        # Статистика за день/неделю/месяц окончания, как daily_stats и др. у таймера
+        "daily_stats": rollups["day"].get(end_keys["day"], empty_stats()),
+        "weekly_stats": rollups["week"].get(end_keys["week"], empty_stats()),
+        "monthly_stats": rollups["month"].get(end_keys["month"], empty_stats()),
+        "rollups": rollups,
+    }
+
+
+def mismatches(cycles, start_time=1.7e9, **settings):
+    """Расхождения simulate() с настоящим PomodoroTimer на тех же настройках (пустой список — совпадают)"""
+    clock = VirtualClock(start_time)
+    timer = run_timer_sessions(simulated_timer(clock, dict(settings)), clock, 2 * cycles)
+    result = simulate(
+        cycles, start_time=start_time,
+        **{key: getattr(timer, key) for key in SETTINGS_LIMITS},
+    )
+    found = []
+    expected = {
+        "pomodoros": timer.total_pomodoros,
+        "points": timer.points,
+        "end_time": clock.time(),
+        "daily_stats": timer.daily_stats,
+        "weekly_stats": timer.weekly_stats,
+        "monthly_stats": timer.monthly_stats,
+    }
+    for name, value in expected.items():
+        if result[name] != value:
+            found.append(f"{name}: симуляция {result[name]!r}, таймер {value!r}")
+    for period, stats in result["rollups"].items():
+        for key, value in stats.items():
+            logged = timer.history.rollup(period, key)
+            if logged != value:
+                found.append(f"{period} {key}: симуляция {value!r}, журнал {logged!r}")
+    columns = timer.history.columns()
+    code = columns.kind_code("long_break")
+    long_breaks = 0 if code is None else columns.kind_id.count(code)
+    if result["long_breaks"] != long_breaks:
+        found.append(f"long_breaks: симуляция {result['long_breaks']}, журнал {long_breaks}")
+    timer.close()
+    return found
+
+
+def main():
+    # Сначала сверка с настоящим таймером на нестандартных настройках
+    found = mismatches(CHECK_CYCLES, work_time=50 * 60, break_time=10 * 60, long_break_time=30 * 60,
+                       sessions_before_long_break=3)
+    if found:
+        print("Симуляция расходится с PomodoroTimer:", *found, sep="\n")
+        return 1
+    cycles = 1_000_000
+    started = time.process_time()
+    result = simulate(cycles)
+    elapsed = time.process_time() - started
+    del result["rollups"]
+    print(result)
+    print(f"{result['sessions'] / elapsed:,.0f} сессий в секунду процессорного времени")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
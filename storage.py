@@ -0,0 +1,371 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from ledger import PointsLedger
+from persistence import DATA_FILE, atomic_write_json, open_log, read_json
+
+logger = logging.getLogger(__name__)
+
+USERS_DB_FILE = "pomodoro_users.db"
+POOL_SIZE = 4
+
+SETTINGS_KEYS = ("theme", "work_time", "break_time", "long_break_time", "sessions_before_long_break")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    points INTEGER NOT NULL DEFAULT 0,
+    settings TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS tags (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    tag_id INTEGER,
+    name TEXT NOT NULL,
+    color TEXT
+);
+CREATE INDEX IF NOT EXISTS tags_by_user ON tags(user_id, id);
+CREATE TABLE IF NOT EXISTS shop_items (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    item_id INTEGER,
+    name TEXT NOT NULL,
+    cost INTEGER NOT NULL,
+    description TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS shop_items_by_user ON shop_items(user_id, id);
+CREATE TABLE IF NOT EXISTS ledger (
+    user_id TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    reason TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (user_id, id)
+) WITHOUT ROWID;
+"""
+
+
+class ConnectionPool:
+    """Небольшой пул соединений SQLite в режиме WAL, общий для потоков процесса"""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Соединение из пула; при выходе без ошибок транзакция фиксируется"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            conn = self._connect() if create else self._idle.get()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+_shared_pools = {}
+_shared_lock = threading.Lock()
+
+
+def shared_pool(path=USERS_DB_FILE):
+    """Пул соединений к базе, общий для всех сессий процесса"""
+    with _shared_lock:
+        if path not in _shared_pools:
+            _shared_pools[path] = ConnectionPool(path)
+        return _shared_pools[path]
+
+
+class Storage:
+    """Хранилище данных одного пользователя.
+
+    load() возвращает данные в формате pomodoro_data.json (или None, если их нет).
+    write() получает изменения changes с момента прошлой записи: "points",
+    "settings" — новые значения, "tags", "shop_items" и "ledger" — добавленные
+    записи, "shop_items_removed" — id удалённых товаров. snapshot() строит
+    полный снимок данных; его стоимость растёт с историей, поэтому хранилища,
+    которым хватает changes, вызывают его только при необходимости.
+    """
+
+    def load(self):
+        raise NotImplementedError
+
+    def write(self, snapshot, changes):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class JsonFileStorage(Storage):
+    """Данные в JSON-файле (однопользовательский режим).
+
+    Журнал очков растёт с историей, поэтому его новые записи дописываются
+    строками JSON в отдельный файл ledger_path, а снимок в path без журнала
+    переписывается, только когда меняются настройки, теги или товары.
+    Данные старого формата с журналом внутри снимка переносятся при первой записи.
+    """
+
+    def __init__(self, path=DATA_FILE, ledger_path=None):
+        self.path = path
+        self.ledger_path = ledger_path if ledger_path is not None else os.path.splitext(path)[0] + ".ledger.jsonl"
+        self._ledger = None  # файл журнала, открытый на дозапись
+        self._settings = None  # настройки последнего записанного снимка
+        self._migrate = False  # журнал ещё лежит внутри снимка
+
+    def load(self):
+        data = read_json(self.path)
+        entries = self._read_ledger()
+        if entries is None:
+            self._migrate = isinstance(data, dict) and bool(data.get("ledger"))
+            return data
+        data = dict(data) if isinstance(data, dict) else {}
+        data["ledger"] = entries
+        # Баланс в снимке не переписывается с каждой записью журнала
+        data["points"] = PointsLedger(entries).balance
+        self._settings = settings_of(data)
+        return data
+
+    def _read_ledger(self):
+        """Записи журнала из ledger_path (None, если файла нет); повторы по id отбрасываются"""
+        try:
+            with open(self.ledger_path, "rb") as f:
+                lines = f.read().split(b"\n")
+        except FileNotFoundError:
+            return None
+        entries = {}
+        # Последняя строка без перевода строки оборвана при сбое
+        for line in lines[:-1]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            entries.setdefault(entry["id"], entry)
+        return list(entries.values())
+
+    def write(self, snapshot, changes):
+        state = None
+        written = 0
+        ledger = changes.get("ledger", ())
+        if self._migrate:
+            state = snapshot()
+            ledger = state["ledger"]
+        if ledger:
+            if self._ledger is None:
+                self._ledger = open_log(self.ledger_path)
+            payload = b"".join(json.dumps(entry, ensure_ascii=False).encode("utf-8") + b"\n" for entry in ledger)
+            self._ledger.write(payload)
+            self._ledger.flush()
+            os.fsync(self._ledger.fileno())
+            written += len(payload)
+        if (
+            self._migrate or self._settings is None
+            or any(section in changes for section in ("tags", "shop_items", "shop_items_removed"))
+            or changes.get("settings", self._settings) != self._settings
+        ):
+            # Журнал уже в ledger_path: сначала дозапись, затем снимок без него
+            state = state if state is not None else snapshot()
+            del state["ledger"]
+            written += atomic_write_json(self.path, state)
+            self._settings = settings_of(state)
+            self._migrate = False
+        return written
+
+    def close(self):
+        if self._ledger is not None:
+            self._ledger.close()
+            self._ledger = None
+
+
+class MemoryStorage(Storage):
+    """Хранилище в памяти для симуляций и замеров: ничего не пишет на диск"""
+
+    def __init__(self, data=None):
+        self.data = data
+        self.writes = 0
+
+    def load(self):
+        return self.data
+
+    def write(self, snapshot, changes):
+        self.data = snapshot()
+        self.writes += 1
+
+
+class SqliteStorage(Storage):
+    """Данные пользователя user_id в общей базе SQLite; каждое изменение — запись строки"""
+
+    _initialized = set()
+    _init_lock = threading.Lock()
+
+    def __init__(self, user_id, pool=None):
+        self.user_id = user_id
+        self.pool = pool if pool is not None else shared_pool()
+        with self._init_lock:
+            if self.pool.path not in self._initialized:
+                with self.pool.connection() as conn:
+                    conn.executescript(SCHEMA)
+                    # Постоянные id тегов и товаров появились позже самих таблиц
+                    for table, column in (("tags", "tag_id"), ("shop_items", "item_id")):
+                        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+                        if column not in columns:
+                            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+                        # По постоянному id запись проверяется на повтор перед вставкой
+                        conn.execute(
+                            f"CREATE INDEX IF NOT EXISTS {table}_by_{column} ON {table}(user_id, {column})"
+                        )
+                self._initialized.add(self.pool.path)
+
+    def load(self):
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                "SELECT points, settings FROM users WHERE user_id = ?", (self.user_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            tags = conn.execute(
+                "SELECT COALESCE(tag_id, id), name, color FROM tags WHERE user_id = ? ORDER BY id",
+                (self.user_id,),
+            ).fetchall()
+            items = conn.execute(
+                "SELECT COALESCE(item_id, id), name, cost, description FROM shop_items"
+                " WHERE user_id = ? ORDER BY id",
+                (self.user_id,),
+            ).fetchall()
+            entries = conn.execute(
+                "SELECT id, kind, amount, reason, created_at FROM ledger WHERE user_id = ? ORDER BY id",
+                (self.user_id,),
+            ).fetchall()
+        data = json.loads(row[1])
+        data["points"] = row[0]
+        data["tags"] = [{"id": tag_id, "name": name, "color": color} for tag_id, name, color in tags]
+        data["shop_items"] = [
+            {"id": item_id, "name": name, "cost": cost, "description": description}
+            for item_id, name, cost, description in items
+        ]
+        data["ledger"] = [
+            {"id": id, "kind": kind, "amount": amount, "reason": reason, "time": created_at}
+            for id, kind, amount, reason, created_at in entries
+        ]
+        return data
+
+    def write(self, snapshot, changes):
+        with self.pool.connection() as conn:
+            created = conn.execute(
+                "INSERT OR IGNORE INTO users (user_id) VALUES (?)", (self.user_id,)
+            ).rowcount
+            if created:
+                # Первая запись пользователя: сохраняется полный снимок. Он снят позже
+                # changes, поэтому записи из него могут прийти снова со следующими
+                # изменениями — вставки ниже их пропускают
+                state = snapshot()
+                changes = dict(
+                    changes, points=state["points"], settings=settings_of(state),
+                    tags=state["tags"], shop_items=state["shop_items"], ledger=state["ledger"],
+                )
+            if "points" in changes:
+                conn.execute(
+                    "UPDATE users SET points = ? WHERE user_id = ?", (changes["points"], self.user_id)
+                )
+            if "settings" in changes:
+                conn.execute(
+                    "UPDATE users SET settings = ? WHERE user_id = ?",
+                    (json.dumps(changes["settings"], ensure_ascii=False), self.user_id),
+                )
+            for tag in changes.get("tags", ()):
+                self._insert_unique(
+                    conn, "tags", "tag_id",
+                    {"tag_id": tag.get("id"), "name": tag["name"], "color": tag["color"]},
+                )
+            for item in changes.get("shop_items", ()):
+                self._insert_unique(
+                    conn, "shop_items", "item_id",
+                    {
+                        "item_id": item.get("id"), "name": item["name"],
+                        "cost": item["cost"], "description": item["description"],
+                    },
+                )
+            conn.executemany(
+                "DELETE FROM shop_items WHERE user_id = ? AND COALESCE(item_id, id) = ?",
+                [(self.user_id, item_id) for item_id in changes.get("shop_items_removed", ())],
+            )
+            for entry in changes.get("ledger", ()):
+                self._insert_unique(
+                    conn, "ledger", "id",
+                    {
+                        "id": entry["id"], "kind": entry["kind"], "amount": entry["amount"],
+                        "reason": entry["reason"], "created_at": entry["time"],
+                    },
+                )
+            if "ledger" in changes:
+                # Баланс — сумма журнала в базе, а не значение последнего писавшего таймера
+                conn.execute(
+                    "UPDATE users SET points = (SELECT SUM(CASE kind WHEN 'spend' THEN -amount"
+                    " ELSE amount END) FROM ledger WHERE user_id = :user)"
+                    " WHERE user_id = :user AND EXISTS (SELECT 1 FROM ledger WHERE user_id = :user)",
+                    {"user": self.user_id},
+                )
+
+    def _insert_unique(self, conn, table, key, row):
+        """Вставка строки с постоянным id row[key].
+
+        Повтор уже сохранённой строки пропускается. Если id занят другой строкой
+        (её записал другой таймер того же пользователя), строка сохраняется под
+        следующим свободным id, чтобы не потерять ни одну из них.
+        """
+        columns = ", ".join(row)
+        params = dict(row, user=self.user_id)
+        values = ", ".join(f":{column}" for column in row)
+        if conn.execute(
+            f"INSERT INTO {table} (user_id, {columns}) SELECT :user, {values}"
+            f" WHERE NOT EXISTS (SELECT 1 FROM {table} WHERE user_id = :user AND {key} = :{key})",
+            params,
+        ).rowcount:
+            return
+        same = " AND ".join(f"{column} IS :{column}" for column in row)
+        if conn.execute(f"SELECT 1 FROM {table} WHERE user_id = :user AND {same}", params).fetchone():
+            return
+        fresh = conn.execute(
+            f"SELECT COALESCE(MAX(COALESCE({key}, id)), 0) + 1 FROM {table} WHERE user_id = ?",
+            (self.user_id,),
+        ).fetchone()[0]
+        logger.warning(
+            "Запись %s с id %s пользователя %s уже занята другой, сохранена под id %s",
+            table, row[key], self.user_id, fresh,
+        )
+        conn.execute(
+            f"INSERT INTO {table} (user_id, {columns}) VALUES (:user, {values})",
+            dict(params, **{key: fresh}),
+        )
+
+def settings_of(state):
+    """Настройки из снимка данных"""
+    return {key: state[key] for key in SETTINGS_KEYS if key in state}
@@ -0,0 +1,53 @@
+from records import Tag
+
+
+class TagRegistry:
+    """Теги пользователя по постоянному id с поиском по имени за O(1).
+
+    Имена уникальны без учёта регистра и пробелов по краям. Повторы из старых
+    данных при загрузке отбрасываются (остаётся первый тег с таким именем),
+    теги без id получают новый.
+    """
+
+    def __init__(self, tags=()):
+        # Теги принимаются записями Tag или словарями в формате pomodoro_data.json
+        tags = [tag if isinstance(tag, Tag) else Tag.from_dict(tag) for tag in tags]
+        self._by_id = {}  # id -> тег, в порядке добавления
+        self._by_name = {}  # нормализованное имя -> тег
+        self._next_id = max((tag.id or 0 for tag in tags), default=0) + 1
+        for tag in tags:
+            self._insert(tag.id, tag.name, tag.color)
+
+    @staticmethod
+    def _key(name):
+        return name.strip().casefold()
+
+    def _insert(self, tag_id, name, color):
+        key = self._key(name)
+        if not key or key in self._by_name:
+            return None
+        if not tag_id or tag_id in self._by_id:
+            tag_id = self._next_id
+            self._next_id += 1
+        tag = Tag(tag_id, name.strip(), color)
+        self._by_id[tag_id] = tag
+        self._by_name[key] = tag
+        return tag
+
+    def add(self, name, color):
+        """Новый тег или None, если имя пустое или уже занято"""
+        return self._insert(None, name, color)
+
+    def get(self, tag_id):
+        """Тег по id (или None)"""
+        return self._by_id.get(tag_id)
+
+    def find(self, name):
+        """Тег по имени без учёта регистра (или None)"""
+        return self._by_name.get(self._key(name))
+
+    def __iter__(self):
+        return iter(list(self._by_id.values()))
+
+    def __len__(self):
+        return len(self._by_id)